@@ -0,0 +1,71 @@
+import argparse
+import os
+
+import pandas as pd
+import streamlit as st
+from pymongo import ASCENDING, UpdateOne
+
+from database import DB_NAME, create_mongo_client, get_db
+
+APPROVED_IDS_CSV = "approved_ids.csv"
+APPROVED_IDS_COLLECTION = "approved_ids"
+
+
+def read_approved_ids(path=APPROVED_IDS_CSV):
+    ids = pd.read_csv(path, dtype=str)["prolific_id"].dropna()
+    return frozenset(ids.str.strip().str.lower())
+
+
+# mtime is part of the cache key, so an edited CSV is picked up without a restart
+@st.cache_resource(max_entries=1)
+def load_approved_ids(path, mtime):
+    return read_approved_ids(path)
+
+
+def get_approved_ids(path=APPROVED_IDS_CSV):
+    if st.secrets.get("APPROVED_IDS_HOT_RELOAD", True):
+        return load_approved_ids(path, os.path.getmtime(path))
+    return load_approved_ids(path, None)
+
+
+@st.cache_resource
+def get_approved_ids_collection():
+    collection = get_db()[APPROVED_IDS_COLLECTION]
+    collection.create_index([("prolific_id_lower", ASCENDING)], unique=True)
+    return collection
+
+
+def is_approved(prolific_id):
+    """Check a login ID against the allow-list (case-insensitive).
+
+    Reads from the `approved_ids` collection when APPROVED_IDS_SOURCE is
+    "mongo" in secrets, otherwise from approved_ids.csv.
+    """
+    key = prolific_id.strip().lower()
+    if st.secrets.get("APPROVED_IDS_SOURCE", "csv") == "mongo":
+        return get_approved_ids_collection().find_one({"prolific_id_lower": key}, {"_id": 1}) is not None
+    return key in get_approved_ids()
+
+
+def sync_to_mongo(collection, ids):
+    """Upsert every ID into the indexed allow-list collection."""
+    collection.create_index([("prolific_id_lower", ASCENDING)], unique=True)
+    ops = [
+        UpdateOne({"prolific_id_lower": i}, {"$set": {"prolific_id_lower": i}}, upsert=True)
+        for i in sorted(ids)
+    ]
+    if not ops:
+        return 0
+    result = collection.bulk_write(ops, ordered=False)
+    return result.upserted_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load approved IDs from a CSV into MongoDB.")
+    parser.add_argument("--csv", default=APPROVED_IDS_CSV)
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI"))
+    args = parser.parse_args()
+
+    client = create_mongo_client(args.mongo_uri)
+    added = sync_to_mongo(client[DB_NAME][APPROVED_IDS_COLLECTION], read_approved_ids(args.csv))
+    print("New approved IDs:", added)
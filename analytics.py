@@ -0,0 +1,122 @@
+import argparse
+import os
+import time
+
+from database import DB_NAME, create_mongo_client
+from export import DEFAULT_CHUNK_ROWS, DEFAULT_CURSOR_BATCH, abstract_pipeline, abstract_rows, write_parquet
+
+QUESTION_KEYS = [f"q{i}" for i in range(1, 6)]
+# union of the static and interactive likert items
+LIKERT_ITEMS = [
+    "simplicity",
+    "coherence",
+    "informativeness",
+    "background_information",
+    "faithfulness",
+    "chatbot_useful",
+    "chatbot_understanding",
+    "understanding",
+    "explanation",
+    "importance",
+    "tailored",
+]
+SOURCE_FIELDS = ["completed", "sata", "likert", "chat_duration_seconds", "term_familarity"]
+
+# one row per (participant, abstract); repeated strings are dictionary-encoded
+COLUMNS = {
+    "prolific_id": "category",
+    "full_type": "category",
+    "phase": "category",
+    "batch_id": "category",
+    "abstract_id": "category",
+    "completed": "bool",
+    # the version of the abstract the SATA answers were given to (None before it was recorded)
+    "content_hash": "category",
+    **{f"{q}_answers": "strings" for q in QUESTION_KEYS},
+    **{f"time_{q}": "float" for q in QUESTION_KEYS},
+    "sata_submitted_at": "timestamp",
+    **{f"likert_{item}": "int" for item in LIKERT_ITEMS},
+    "likert_time_spent_seconds": "float",
+    "chat_duration_seconds": "float",
+    "terms_rated": "int",
+    "familiarity_mean": "float",
+    "familiarity_min": "int",
+    "terms_extra_info": "int",
+}
+
+
+def likert_score(value):
+    """'3 — Fair' -> 3."""
+    if isinstance(value, str):
+        head = value.split(" ", 1)[0]
+        return int(head) if head.isdigit() else None
+    return value
+
+
+def familiarity_scores(terms):
+    # the term page saves {"term", "familiarity_score", "extra_information"};
+    # "familiar" is only the None placeholder written at provisioning
+    scores = [t["familiarity_score"] for t in terms or [] if isinstance(t.get("familiarity_score"), int)]
+    extra = [t for t in terms or [] if [o for o in t.get("extra_information") or [] if o != "None"]]
+    return {
+        "terms_rated": len(scores),
+        "familiarity_mean": sum(scores) / len(scores) if scores else None,
+        "familiarity_min": min(scores) if scores else None,
+        "terms_extra_info": len(extra),
+    }
+
+
+def flatten(row):
+    phase_type, batch_id = row["full_type"].split("_")
+    sata = row.get("sata") or {}
+    answers = sata.get("sata_answers") or {}
+    likert = row.get("likert") or {}
+    responses = likert.get("responses") or {}
+
+    flat = {
+        "prolific_id": row["prolific_id"],
+        "full_type": row["full_type"],
+        "phase": phase_type,
+        "batch_id": batch_id,
+        "abstract_id": row["abstract_id"],
+        "completed": row.get("completed"),
+        "content_hash": sata.get("content_hash"),
+        "sata_submitted_at": sata.get("submitted_at"),
+        "likert_time_spent_seconds": likert.get("time_spent_seconds"),
+        "chat_duration_seconds": row.get("chat_duration_seconds"),
+    }
+    for q in QUESTION_KEYS:
+        flat[f"{q}_answers"] = answers.get(q)
+        flat[f"time_{q}"] = sata.get(f"time_{q}")
+    for item in LIKERT_ITEMS:
+        flat[f"likert_{item}"] = likert_score(responses.get(item))
+    flat.update(familiarity_scores(row.get("term_familarity")))
+    return flat
+
+
+def iter_abstract_rows(collection, cursor_batch=DEFAULT_CURSOR_BATCH):
+    for doc in collection.aggregate(abstract_pipeline(SOURCE_FIELDS), batchSize=cursor_batch):
+        for row in abstract_rows(doc, SOURCE_FIELDS):
+            yield flatten(row)
+
+
+def build_abstract_table(collection, path, compress=False,
+                         cursor_batch=DEFAULT_CURSOR_BATCH, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write the tidy (participant, abstract) table to Parquet; returns the row count."""
+    return write_parquet(iter_abstract_rows(collection, cursor_batch), path, COLUMNS, compress, chunk_rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flatten participant documents into one Parquet table.")
+    parser.add_argument("--out", default=os.path.join("exports", "abstracts.parquet"))
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI"))
+    parser.add_argument("--cursor-batch", type=int, default=DEFAULT_CURSOR_BATCH)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    start = time.time()
+    users_collection = create_mongo_client(args.mongo_uri)[DB_NAME]["users"]
+    count = build_abstract_table(users_collection, args.out, args.gzip, args.cursor_batch, args.chunk_rows)
+    print(f"{count} rows -> {args.out} ({time.time() - start:.1f}s)")
@@ -0,0 +1,65 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def normalize_question(text):
+    """Case, punctuation and whitespace-insensitive form of a question."""
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def cache_key(abstract_id, history, question):
+    """Key for an answer; `history` is every message before the question.
+
+    The whole prior conversation is part of the key, so a cached answer is
+    only reused when the conversation so far is empty or identical.
+    """
+    prior = tuple((m["role"], normalize_question(m["content"])) for m in history)
+    return (str(abstract_id), prior, normalize_question(question))
+
+
+class AnswerCache:
+    """Thread-safe LRU of chatbot answers with a time-to-live."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, answer):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), answer)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# shared by every session on this server process
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache(
+        max_entries=int(st.secrets.get("CHAT_ANSWER_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=float(st.secrets.get("CHAT_ANSWER_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+    )
@@ -1,22 +1,13 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import bootstrap_indexes, get_users_collection, get_abstracts_collection
+from pymongo.errors import DuplicateKeyError
+from repository import ParticipantRepository
+from corpus import get_abstract_content, upsert_corpus
+from allowlist import is_approved
+from assignments import BATCH_ORDER, build_user_phases, get_user_assignments, prepare_assignments
 import datetime
-import pandas as pd
-from openai import OpenAI
 from pages.chatbot import run_chatbot
 from pages.term_familarity_page import run_terms
-import ftfy
-import re
-
-# order of the batches
-BATCH_ORDER = [
-    "static_1",
-    "static_2",
-    "interactive_3",
-    "interactive_4",
-    "finetuned_5",
-    "finetuned_6",
-]
 
 # passcodes for each batch, first batch has none
 PASSCODES = {
@@ -40,41 +31,24 @@ st.markdown(
 # set the page to wide mode
 st.set_page_config(layout="wide")
 
-# connect to mongodb
-@st.cache_resource
-def get_mongo_client():
-    return MongoClient(st.secrets["MONGO_URI"])
-MONGO_URI = st.secrets["MONGO_URI"]
-client = MongoClient(MONGO_URI)
-db = client["pls"]
-users_collection = db["users"]
-abstract_collection = db['abstracts']
-
-# load approved IDs and dataframe for all the abstracts etc., 
-approved_ids = pd.read_csv("approved_ids.csv")["prolific_id"].tolist()
-user_df = pd.read_csv("final_user_batches.csv", encoding="latin1")
+# connect to MongoDB through the shared pooled client
+users_collection = get_users_collection()
+abstract_collection = get_abstracts_collection()
+bootstrap_indexes()
+participants = ParticipantRepository(users_collection, cache=st.session_state, content=get_abstract_content)
 
 # determine what batch user will start off with 
-def get_current_batch(user_doc):
-    phases = user_doc.get("phases", {})
-
-    for full_type in BATCH_ORDER:
-        phase_type, batch_id = full_type.split("_")
-        phase = phases.get(phase_type, {})
-        batches = phase.get("batches", {})
-        batch = batches.get(batch_id)
-
-        # Skip if this batch doesn't exist for this user
-        if batch is None:
-            continue
+def get_current_batch(prolific_id):
+    states = participants.get_batch_states(prolific_id, BATCH_ORDER) or []
 
-        # get the first incomplete batch 
-        if not batch.get("completed", False):
+    # get the first incomplete batch 
+    for state in states:
+        if not state.completed:
             return {
-                "full_type": full_type,
-                "phase_type": phase_type,
-                "batch_id": batch_id,
-                "unlocked": batch.get("unlocked", False),
+                "full_type": state.full_type,
+                "phase_type": state.phase_type,
+                "batch_id": state.batch_id,
+                "unlocked": state.unlocked,
             }
 
     return None
@@ -91,94 +65,42 @@ if not st.session_state.get("logged_in", False):
             st.error("Please enter your Prolific ID.")
             st.stop()
 
-        if prolific_id.lower() not in [str(id).lower() for id in approved_ids]:
+        if not is_approved(prolific_id):
             st.error("Sorry, your Prolific ID is not approved for this study.")
             st.stop()
 
-        # check if user exists if it doesn't exist create using user_df
-        user = users_collection.find_one({"prolific_id": prolific_id})
-        if not user:
+        # drop any document cached by an earlier login in this browser session
+        participants.invalidate()
+
+        # check if user exists if it doesn't exist create from the assignment sheet
+        if not participants.exists(prolific_id):
             # grab all rows assigned to this user from the spreadsheet
-            user_rows = user_df[user_df["user_id"] == prolific_id]
+            user_rows = get_user_assignments(prolific_id)
 
             if user_rows.empty:
                 st.error("No assignments found for this user. Please contact the study administrator.")
                 st.stop()
 
-            phases = {
-                "static": {"batches": {}, "completed": False},
-                "interactive": {"batches": {}, "completed": False},
-                "finetuned": {"batches": {}, "completed": False},
-            }
+            prepared = prepare_assignments(user_rows)
+            upsert_corpus(abstract_collection, prepared)
+            phases = build_user_phases(prepared.to_dict("records"))
+
+            try:
+                users_collection.insert_one({
+                    "prolific_id": prolific_id,
+                    "created_at": datetime.datetime.utcnow(),
+                    "accepted_terms": True,
+                    "phases": phases,
+                })
+            except DuplicateKeyError:
+                # another session created this participant first (unique prolific_id index)
+                pass
+        elif not participants.has_accepted_terms(prolific_id):
+            # provisioned offline (provision.py), terms are accepted on first login
+            participants.update(prolific_id, {"$set": {"accepted_terms": True}})
 
-            for _, row in user_rows.iterrows():
-                full_type = row["type"]              # e.g. "static_1"
-                phase_type, batch_id = full_type.split("_")
-
-                # initialize batch if needed
-                if batch_id not in phases[phase_type]["batches"]:
-                    is_first_batch = (full_type == BATCH_ORDER[0])
-                    phases[phase_type]["batches"][batch_id] = {
-                        "completed": False,
-                        "approved": False,
-                        "unlocked": is_first_batch,
-                        "abstracts": {},
-                        "full_type": full_type,
-                    }
-
-                # build term familiarity only for static
-                if phase_type == "static":
-                    raw_terms = str(row["terms"]).strip().strip("[]")
-                    term_list = [t.strip() for t in raw_terms.split(",") if t.strip()]
-                    structured_terms = [
-                        {"term": t, "familiar": None, "extra_information": None}
-                        for t in term_list
-                    ]
-                else:
-                    structured_terms = []
-
-                abstract_key = str(row["abstract_id"])
-                phases[phase_type]["batches"][batch_id]["abstracts"][abstract_key] = {
-                    "abstract_title": row["abstract_title"],
-                    "abstract": re.sub(r"\s+", " ", ftfy.fix_text(row["abstract"])).strip(),
-                    "human_written_pls": re.sub(r"\s+", " ", ftfy.fix_text(row["human_written"])).strip(),
-
-                    # SATA questions
-                    "question_1": row["question_1"],
-                    "question_2": row["question_2"],
-                    "question_3": row["question_3"],
-                    "question_4": row["question_4"],
-                    "question_5": row["question_5"],
-                    "question_1_answers_choices": row["question_1_answers_choices"],
-                    "question_1_correct_answers": row["question_1_correct_answers"],
-                    "question_2_answers_choices": row["question_2_answers_choices"],
-                    "question_2_correct_answers": row["question_2_correct_answers"],
-                    "question_3_answers_choices": row["question_3_answers_choices"],
-                    "question_3_correct_answers": row["question_3_correct_answers"],
-                    "question_4_answers_choices": row["question_4_answers_choices"],
-                    "question_4_correct_answers": row["question_4_correct_answers"],
-                    "question_5_answers_choices": row["question_5_answers_choices"],
-                    "question_5_correct_answers": row["question_5_correct_answers"],
-
-                    "term_familarity": structured_terms,
-                    "short_answers": {},
-                    "completed": False,
-                }
-
-            users_collection.insert_one({
-                "prolific_id": prolific_id,
-                "created_at": datetime.datetime.utcnow(),
-                "accepted_terms": True,
-                "phases": phases,
-            })
-
-            user = users_collection.find_one({"prolific_id": prolific_id})
         # restore progress index if available
-        start_index = (
-            user.get("phases", {})
-                .get("interactive", {})
-                .get("last_completed_index", 0)
-        )
+        start_index = participants.get_last_completed_index(prolific_id)
         st.session_state.abstract_index = start_index
 
         # save login state
@@ -196,8 +118,7 @@ else:
     if "current_page" not in st.session_state:
         st.session_state.current_page = "chatbot"
 
-    user = users_collection.find_one({"prolific_id": st.session_state.prolific_id})
-    current = get_current_batch(user)
+    current = get_current_batch(st.session_state.prolific_id)
 
     if current is None:
         st.success("🎉 You have completed all batches! Thank you!")
@@ -222,8 +143,8 @@ else:
                 phase = current["phase_type"]
                 batch_id = current["batch_id"]
 
-                users_collection.update_one(
-                    {"prolific_id": st.session_state.prolific_id},
+                participants.update(
+                    st.session_state.prolific_id,
                     {"$set": {f"phases.{phase}.batches.{batch_id}.unlocked": True}}
                 )
                 st.success("Unlocked! Loading batch…")
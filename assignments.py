@@ -0,0 +1,125 @@
+import os
+import re
+
+import ftfy
+import pandas as pd
+import streamlit as st
+
+ASSIGNMENTS_CSV = "final_user_batches.csv"
+
+# order of the batches
+BATCH_ORDER = [
+    "static_1",
+    "static_2",
+    "interactive_3",
+    "interactive_4",
+    "finetuned_5",
+    "finetuned_6",
+]
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def read_assignments(path=ASSIGNMENTS_CSV):
+    return pd.read_csv(path, encoding="latin1")
+
+
+def index_assignments(df):
+    """Split the assignment sheet into one frame per user_id."""
+    return {str(user_id): rows for user_id, rows in df.groupby("user_id", sort=False)}
+
+
+# parsed and indexed once per process; the mtime in the key picks up a new recruitment wave
+@st.cache_resource(max_entries=1)
+def load_assignment_index(path, mtime):
+    return index_assignments(read_assignments(path))
+
+
+def get_user_assignments(prolific_id, path=ASSIGNMENTS_CSV):
+    """Rows assigned to this user, or an empty frame. Only needed at provisioning."""
+    index = load_assignment_index(path, os.path.getmtime(path))
+    rows = index.get(prolific_id)
+    if rows is None:
+        return pd.DataFrame()
+    return rows
+
+
+def clean_text(x):
+    if pd.isna(x):
+        return ""
+    return WHITESPACE_RE.sub(" ", ftfy.fix_text(str(x))).strip()
+
+
+def clean_text_column(col):
+    """Run clean_text once per distinct value; shared abstracts are only fixed once."""
+    cleaned = {value: clean_text(value) for value in col.dropna().unique()}
+    return col.map(cleaned).fillna("")
+
+
+def parse_terms_column(col):
+    raw = col.astype(str).str.strip().str.strip("[]").str.split(",")
+    return raw.map(lambda terms: [t.strip() for t in terms if t.strip()])
+
+
+def prepare_assignments(df):
+    """Vectorized cleaning of the whole sheet before any documents are built."""
+    df = df.copy()
+    df["user_id"] = df["user_id"].astype(str)
+    df["abstract_id"] = df["abstract_id"].astype(str)
+    df["phase_type"] = df["type"].str.split("_").str[0]
+    df["batch_id"] = df["type"].str.split("_").str[1]
+    df["abstract_title"] = clean_text_column(df["abstract_title"])
+    df["abstract"] = clean_text_column(df["abstract"])
+    df["human_written_pls"] = clean_text_column(df["human_written"])
+    # build term familiarity only for static
+    df["term_list"] = parse_terms_column(df["terms"]).where(df["phase_type"] == "static", None)
+    return df
+
+
+def empty_phases():
+    return {
+        "static": {"batches": {}, "completed": False},
+        "interactive": {"batches": {}, "completed": False},
+        "finetuned": {"batches": {}, "completed": False},
+    }
+
+
+def build_abstract(row):
+    structured_terms = [
+        {"term": t, "familiar": None, "extra_information": None}
+        for t in (row["term_list"] or [])
+    ]
+    # title, text, PLS and SATA items live once per abstract_id in db["abstracts"] (corpus.py)
+    return {
+        "term_familarity": structured_terms,
+        "short_answers": {},
+        "completed": False,
+    }
+
+
+def build_user_phases(prepared_rows):
+    """Build the `phases` document for one user from prepared assignment rows."""
+    phases = empty_phases()
+    for row in prepared_rows:
+        full_type = row["type"]
+        batches = phases[row["phase_type"]]["batches"]
+
+        # initialize batch if needed
+        if row["batch_id"] not in batches:
+            batches[row["batch_id"]] = {
+                "completed": False,
+                "approved": False,
+                "unlocked": full_type == BATCH_ORDER[0],
+                "abstracts": {},
+                "full_type": full_type,
+            }
+        batches[row["batch_id"]]["abstracts"][row["abstract_id"]] = build_abstract(row)
+    return phases
+
+
+def build_all_phases(prepared):
+    """Map every user_id in a prepared sheet to its `phases` document in one pass."""
+    by_user = {}
+    for row in prepared.to_dict("records"):
+        by_user.setdefault(row["user_id"], []).append(row)
+    return {user_id: build_user_phases(rows) for user_id, rows in by_user.items()}
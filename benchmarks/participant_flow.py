@@ -0,0 +1,585 @@
+"""Load test for the participant flow.
+
+Drives the real app with Streamlit's AppTest: scripted participants log in
+through app.py, rate terms (run_terms), answer the SATA questions
+(static_short_answer) and the Likert survey (static_likert), then chat
+(run_chatbot), answer short_answers and likert for the interactive batch.
+The LLM is the offline stub from llm_backends, and MongoDB is mongomock
+(pip install mongomock) unless --mongo-uri points at a local mongod.
+
+Participants in one process are interleaved step by step, so they share
+the caches, connection pool and LLM gateway the way concurrent sessions of
+one server do. --workers starts several such processes (needs a mongod).
+
+Reports p50/p95/p99 render time, Mongo round trips, Mongo bytes and bytes
+sent to the browser per page. Save a run with --json to compare against.
+With a mongod the query plans of the main lookups are checked as well, and
+the run fails if any of them is a collection scan.
+
+    python benchmarks/participant_flow.py --participants 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+from urllib.parse import urlparse
+
+import bson
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+from allowlist import sync_to_mongo  # noqa: E402
+from analytics import SOURCE_FIELDS, flatten  # noqa: E402
+from assignments import BATCH_ORDER, read_assignments  # noqa: E402
+from export import abstract_pipeline, abstract_rows  # noqa: E402
+from provision import provision  # noqa: E402
+from repository import SATA_FIELDS  # noqa: E402
+
+APP = os.path.join(ROOT, "app.py")
+# the sheet in the repo; assignments.ASSIGNMENTS_CSV is only on the study server
+BENCH_CSV = os.path.join(ROOT, "final_user_batches_new.csv")
+# AppTest has no public API for the page on screen and nothing public counts the
+# bytes sent to the browser; the private attributes used for both are from this version
+STREAMLIT_TESTED = "1.66.0"
+PID_PREFIX = "bench_"
+QUESTIONS = [
+    "What does this study compare?",
+    "What were the main results?",
+    "How sure are the researchers about these results?",
+    "Who could this treatment help?",
+]
+FAMILIARITY = "Familiar"
+# the term page's slider options; the saved familiarity_score is the index
+LIKERT_FAMILIARITY = ["— Select familiarity —", "Not familiar", "Somewhat unfamiliar",
+                      "Moderately familiar", "Familiar", "Extremely familiar"]
+LIKERT_CHOICE = 3
+MAX_STEPS = 300
+PAGE_NAMES = {"term_familarity_page": "run_terms", "chatbot": "run_chatbot"}
+
+
+class Meter:
+    """Mongo round trips and bytes, plus bytes sent to the browser, since the last reset."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.round_trips = 0
+        self.mongo_bytes = 0
+        self.ui_bytes = 0
+
+
+METER = Meter()
+
+
+def bson_size(value):
+    if isinstance(value, dict):
+        return len(bson.encode(value))
+    if isinstance(value, (list, tuple)):
+        return sum(bson_size(v) for v in value)
+    return 0
+
+
+class CountingCollection:
+    """mongomock collection that counts every call as a round trip."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if name in ("find", "aggregate"):
+                result = list(result)
+            METER.round_trips += 1
+            METER.mongo_bytes += bson_size(args) + bson_size(result)
+            return result
+        return call
+
+
+class CountingDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name])
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+class CountingClient:
+    def __init__(self, client):
+        self._client = client
+
+    def __getitem__(self, name):
+        return CountingDatabase(self._client[name])
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def command_listener():
+    from pymongo import monitoring
+
+    class Listener(monitoring.CommandListener):
+        def started(self, event):
+            METER.round_trips += 1
+            METER.mongo_bytes += len(bson.encode(event.command))
+
+        def succeeded(self, event):
+            METER.mongo_bytes += len(bson.encode(event.reply))
+
+        def failed(self, event):
+            pass
+
+    return Listener()
+
+
+def streamlit_internals_error(what):
+    import streamlit
+    return SystemExit(
+        f"{what} is not in streamlit {streamlit.__version__}; this benchmark relies on streamlit "
+        f"internals and was written against {STREAMLIT_TESTED} (pip install streamlit=={STREAMLIT_TESTED})"
+    )
+
+
+def meter_forward_msgs():
+    try:
+        from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+        enqueue = ForwardMsgQueue.enqueue
+    except (ImportError, AttributeError):
+        raise streamlit_internals_error("ForwardMsgQueue.enqueue")
+
+    def counting_enqueue(self, msg):
+        METER.ui_bytes += msg.ByteSize()
+        return enqueue(self, msg)
+
+    ForwardMsgQueue.enqueue = counting_enqueue
+
+
+def connect(mongo_uri):
+    """Point database.py (and so every page) at the benchmark database."""
+    if mongo_uri is None:
+        import mongomock
+        client = CountingClient(mongomock.MongoClient())
+        database.create_mongo_client = lambda uri, **kwargs: client
+        return client
+
+    from pymongo import monitoring
+    monitoring.register(command_listener())
+    create = database.create_mongo_client
+    database.create_mongo_client = lambda uri, **kwargs: create(mongo_uri, **kwargs)
+    return create(mongo_uri)
+
+
+def pick_rows(df, prefix, abstracts):
+    """`abstracts` distinct abstracts of one batch type with all SATA fields filled in."""
+    rows = df[df["type"].str.startswith(prefix) & df[list(SATA_FIELDS)].notna().all(axis=1)]
+    if rows.empty:
+        raise SystemExit(f"no {prefix} abstracts with complete SATA questions in the sheet")
+    full_type = rows["type"].iloc[0]
+    rows = rows[rows["type"] == full_type].drop_duplicates("abstract_id").head(abstracts)
+    return rows, full_type
+
+
+def synthetic_assignments(df, participants, abstracts):
+    """Assignment rows for `participants` identical users with one static and one interactive batch."""
+    static_rows, _ = pick_rows(df, "static", abstracts)
+    interactive_rows, interactive_type = pick_rows(df, "interactive", abstracts)
+    rows = pd.concat([static_rows, interactive_rows])
+    copies = []
+    for i in range(participants):
+        copy = rows.copy()
+        copy["user_id"] = f"{PID_PREFIX}{i:04d}"
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True), interactive_type
+
+
+def setup_data(client, df, interactive_type):
+    db = client[database.DB_NAME]
+    db["users"].delete_many({"prolific_id": {"$regex": f"^{PID_PREFIX}"}})
+    provision(db["users"], db["abstracts"], df)
+    # the passcode screen is not part of what we measure
+    phase, batch_id = interactive_type.split("_")
+    db["users"].update_many(
+        {"prolific_id": {"$regex": f"^{PID_PREFIX}"}},
+        {"$set": {f"phases.{phase}.batches.{batch_id}.unlocked": True}},
+    )
+    sync_to_mongo(db["approved_ids"], set(df["user_id"]))
+
+
+def cleanup_data(client):
+    db = client[database.DB_NAME]
+    db["users"].delete_many({"prolific_id": {"$regex": f"^{PID_PREFIX}"}})
+    db["approved_ids"].delete_many({"prolific_id_lower": {"$regex": f"^{PID_PREFIX}"}})
+
+
+def explain_queries():
+    """(collection, filter) for the lookups the app and the admin scripts depend on."""
+    queries = [
+        ("users", {"prolific_id": f"{PID_PREFIX}0000"}),
+        ("users", {"last_full_type": BATCH_ORDER[0]}),
+        ("abstracts", {"abstract_id": "1"}),
+        ("approved_ids", {"prolific_id_lower": f"{PID_PREFIX}0000"}),
+    ]
+    for full_type in BATCH_ORDER:
+        phase_type, batch_id = full_type.split("_")
+        queries.append(("users", {f"phases.{phase_type}.batches.{batch_id}.completed": True}))
+    return queries
+
+
+def has_collscan(plan):
+    if isinstance(plan, dict):
+        return plan.get("stage") == "COLLSCAN" or any(has_collscan(v) for v in plan.values())
+    if isinstance(plan, list):
+        return any(has_collscan(v) for v in plan)
+    return False
+
+
+def check_query_plans(db):
+    """Queries from explain_queries() whose winning plan scans the whole collection."""
+    scans = []
+    for name, query in explain_queries():
+        plan = db.command("explain", {"find": name, "filter": query}, verbosity="queryPlanner")
+        if has_collscan(plan["queryPlanner"]["winningPlan"]):
+            scans.append((name, query))
+    return scans
+
+
+def check_analytics(db):
+    """Completed static abstracts whose flattened term familiarity doesn't match what the pages saved.
+
+    Every slider is set to FAMILIARITY, so each rated term should count with that score.
+    SATA answers must record the version they were given to, so scoring.py can find their key.
+    """
+    expected = LIKERT_FAMILIARITY.index(FAMILIARITY)
+    current = {d["abstract_id"]: d.get("content_hash") for d in db["abstracts"].find({}, {"_id": 0, "abstract_id": 1, "content_hash": 1})}
+    pipeline = [{"$match": {"prolific_id": {"$regex": f"^{PID_PREFIX}"}}}] + abstract_pipeline(SOURCE_FIELDS)
+    mismatches = []
+    for doc in db["users"].aggregate(pipeline):
+        for row in abstract_rows(doc, SOURCE_FIELDS):
+            sata = row.get("sata") or {}
+            if sata.get("sata_answers") and sata.get("content_hash") != current.get(row["abstract_id"]):
+                mismatches.append((row["prolific_id"], row["abstract_id"], f"sata content_hash={sata.get('content_hash')}"))
+            terms = row.get("term_familarity") or []
+            if not row["full_type"].startswith("static") or not row.get("completed") or not terms:
+                continue
+            flat = flatten(row)
+            if flat["terms_rated"] != len(terms) or flat["familiarity_mean"] != expected:
+                mismatches.append((row["prolific_id"], row["abstract_id"],
+                                   f"terms_rated={flat['terms_rated']}, familiarity_mean={flat['familiarity_mean']}"))
+    return mismatches
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def find_button(at, label):
+    return next((b for b in at.button if b.label == label and not b.disabled), None)
+
+
+class Participant:
+    """One scripted participant; each step acts on the current page and reruns it."""
+
+    def __init__(self, prolific_id, secrets, questions):
+        self.prolific_id = prolific_id
+        self.secrets = secrets
+        self.questions = questions
+        self.phase = "static"
+        self.done = False
+        self.steps = 0
+        self.new_session()
+
+    def new_session(self):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP, default_timeout=120)
+        self.at.secrets.update(self.secrets)
+        self.asked = 0
+        self.started = False
+
+    def page(self):
+        """Name of the page currently on screen."""
+        at = self.at
+        try:
+            info = at._registered_pages.get(at._finished_page_script_hash, {})
+        except AttributeError:
+            raise streamlit_internals_error("AppTest._registered_pages / _finished_page_script_hash")
+        name = os.path.splitext(os.path.basename(str(info.get("script_path", APP))))[0]
+        if name != "app":
+            return PAGE_NAMES.get(name, name)
+        if "logged_in" not in at.session_state or not at.session_state["logged_in"]:
+            return "login"
+        return "run_terms" if self.phase == "static" else "run_chatbot"
+
+    def act(self, page):
+        """Fill in the page like a participant would and press the next button."""
+        at = self.at
+        if page == "login":
+            at.text_input[0].input(self.prolific_id)
+            return find_button(at, "Enter")
+
+        start = find_button(at, "Start")
+        if start is not None:
+            return start
+
+        if page == "run_terms":
+            sliders = [s for s in at.select_slider if s.key and s.key.startswith("fam_")]
+            if sliders:
+                for s in sliders:
+                    s.set_value(FAMILIARITY)
+                return next(b for b in at.button if b.key and b.key.startswith("next_btn_fam_"))
+            for c in at.checkbox:
+                if c.key and c.key.endswith("_none"):
+                    c.check()
+            return next(b for b in at.button if b.key and b.key.startswith("next_extra_"))
+
+        if page in ("static_short_answer", "short_answers"):
+            if at.checkbox and not any(c.value for c in at.checkbox):
+                at.checkbox[0].check()
+            return find_button(at, "Next Question ➡") or find_button(at, "Submit")
+
+        if page in ("static_likert", "likert"):
+            confirm = find_button(at, "Yes")
+            if confirm is not None:
+                return confirm
+            for r in at.radio:
+                if r.value is None:
+                    r.set_value(r.options[LIKERT_CHOICE])
+            return find_button(at, "Done ➡️") or find_button(at, "Done")
+
+        if page == "run_chatbot":
+            if find_button(at, "Yes ➡️") is not None:
+                # AppTest reruns the whole script rather than just the dialog, which would
+                # lose the click, so apply what the dialog's Yes button does
+                at.session_state["generating_summary"] = True
+                at.session_state["dialog_generating"] = True
+                at.session_state["chat_duration_seconds"] = time.time() - at.session_state["chat_start_time"]
+                return None
+            if self.asked < self.questions:
+                at.chat_input[0].set_value(QUESTIONS[self.asked % len(QUESTIONS)])
+                self.asked += 1
+                return None
+            return find_button(at, "✅ I'm done asking questions")
+
+        if page == "completed_phase":
+            if any("recorded" in s.value for s in at.success):
+                if self.phase == "interactive":
+                    self.done = True
+                    return None
+                # comes back later through the study link, in a new session
+                self.phase = "interactive"
+                self.new_session()
+                return None
+            at.radio[0].set_value(at.radio[0].options[0])
+            return find_button(at, "Submit answer")
+
+        raise RuntimeError(f"don't know how to act on page {page!r}")
+
+    def step(self):
+        """Act and rerun once. Returns (page, seconds, meter) or None when finished."""
+        if self.started:
+            page = self.page()
+            button = self.act(page)
+            if self.done:
+                return None
+            if button is not None:
+                button.click()
+        if not self.started:
+            # first load of a new browser session
+            page = "login"
+            self.started = True
+        at = self.at
+
+        METER.reset()
+        start = time.perf_counter()
+        # the pages print debugging output, keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            at.run()
+        elapsed = time.perf_counter() - start
+        self.steps += 1
+
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        if any("completed all batches" in s.value for s in at.success):
+            self.done = True
+        if self.steps > MAX_STEPS:
+            raise RuntimeError(f"stuck on {self.page()!r}")
+        return page, elapsed, METER.round_trips, METER.mongo_bytes, METER.ui_bytes
+
+
+def run_worker(args):
+    """Run a slice of participants interleaved in this process. Returns samples and errors."""
+    prolific_ids, secrets, questions, mongo_uri, client = args
+    if client is None:
+        client = connect(mongo_uri)
+    meter_forward_msgs()
+
+    participants = [Participant(pid, secrets, questions) for pid in prolific_ids]
+    samples = []
+    errors = {}
+    active = list(participants)
+    while active:
+        for p in list(active):
+            try:
+                sample = p.step()
+            except Exception as e:
+                errors[p.prolific_id] = repr(e)
+                active.remove(p)
+                continue
+            if sample is None:
+                active.remove(p)
+            else:
+                samples.append(sample)
+
+    from llm_gateway import get_llm_gateway
+    return samples, errors, get_llm_gateway().metrics()
+
+
+def report(samples, errors, llm_metrics, participants, wall):
+    by_page = defaultdict(list)
+    for sample in samples:
+        by_page[sample[0]].append(sample[1:])
+
+    header = f"{'page':<22}{'runs':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mongo rt':>10}{'mongo KB':>10}{'ui KB':>8}"
+    print(header)
+    print("-" * len(header))
+    summary = {}
+    for page, rows in sorted(by_page.items()):
+        times = [r[0] * 1000 for r in rows]
+        stats = {
+            "runs": len(rows),
+            "p50_ms": percentile(times, 50),
+            "p95_ms": percentile(times, 95),
+            "p99_ms": percentile(times, 99),
+            "mongo_round_trips": sum(r[1] for r in rows) / len(rows),
+            "mongo_kb": sum(r[2] for r in rows) / len(rows) / 1024,
+            "ui_kb": sum(r[3] for r in rows) / len(rows) / 1024,
+        }
+        summary[page] = stats
+        print(
+            f"{page:<22}{stats['runs']:>6}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+            f"{stats['mongo_round_trips']:>10.1f}{stats['mongo_kb']:>10.1f}{stats['ui_kb']:>8.1f}"
+        )
+    print("(round trips and KB are per run)")
+    print(f"\n{participants - len(errors)}/{participants} participants finished in {wall:.1f}s")
+    for metrics in llm_metrics:
+        print("LLM gateway:", metrics)
+    for pid, error in errors.items():
+        print(f"FAILED {pid}: {error}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the participant flow with scripted participants.")
+    parser.add_argument("--csv", default=BENCH_CSV, help="assignment sheet to copy a template participant from")
+    parser.add_argument("--participants", type=int, default=10)
+    parser.add_argument("--abstracts", type=int, default=1, help="abstracts per batch for each participant")
+    parser.add_argument("--questions", type=int, default=3, help="chatbot questions per abstract (at least 3)")
+    parser.add_argument("--workers", type=int, default=1, help="processes; more than one needs --mongo-uri")
+    parser.add_argument("--mongo-uri", default=None, help="local mongod to use instead of mongomock")
+    parser.add_argument("--allow-remote", action="store_true", help="allow a --mongo-uri that is not localhost")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="stub seconds to first token")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=50)
+    parser.add_argument("--llm-tokens", type=int, default=120)
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    parser.add_argument("--json", help="write the per-page summary to this file")
+    args = parser.parse_args()
+
+    if args.workers > 1 and args.mongo_uri is None:
+        parser.error("--workers > 1 needs a shared database, pass --mongo-uri")
+    if args.mongo_uri and not args.allow_remote:
+        host = urlparse(args.mongo_uri).hostname
+        if host not in ("localhost", "127.0.0.1", "::1"):
+            parser.error("refusing to write benchmark participants to a remote database (use --allow-remote)")
+    if args.questions < 3:
+        parser.error("the chatbot needs at least 3 questions")
+
+    # the pages open files (example_user.csv, ...) relative to the app directory
+    os.chdir(ROOT)
+    df, interactive_type = synthetic_assignments(read_assignments(args.csv), args.participants, args.abstracts)
+    client = connect(args.mongo_uri)
+    if args.mongo_uri:
+        # mongomock treats an index created via IndexModel as different from the
+        # same index created by create_index(), so only real servers get these up front
+        database.ensure_indexes(client[database.DB_NAME])
+    setup_data(client, df, interactive_type)
+
+    secrets = {
+        "MONGO_URI": args.mongo_uri or "mongodb://localhost",
+        "OPENAI_API_KEY": "unused",
+        "APPROVED_IDS_SOURCE": "mongo",
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY": args.llm_latency,
+        "LLM_STUB_TOKENS_PER_SEC": args.llm_tokens_per_sec,
+        "LLM_STUB_TOKENS": args.llm_tokens,
+        "LLM_MAX_CONCURRENCY": args.llm_concurrency,
+    }
+    prolific_ids = sorted(df["user_id"].unique())
+    slices = [prolific_ids[i::args.workers] for i in range(args.workers)]
+
+    start = time.perf_counter()
+    if args.workers == 1:
+        results = [run_worker((slices[0], secrets, args.questions, args.mongo_uri, client))]
+    else:
+        with Pool(args.workers) as pool:
+            results = pool.map(run_worker, [(s, secrets, args.questions, args.mongo_uri, None) for s in slices])
+    wall = time.perf_counter() - start
+
+    samples = [s for r in results for s in r[0]]
+    errors = {pid: e for r in results for pid, e in r[1].items()}
+    summary = report(samples, errors, [r[2] for r in results], len(prolific_ids), wall)
+
+    mismatches = check_analytics(client[database.DB_NAME])
+    for pid, abstract_id, detail in mismatches:
+        print(f"Analytics mismatch for {pid} abstract {abstract_id}: {detail}")
+    if not mismatches:
+        print("Analytics: term familiarity and SATA versions flatten as the pages saved them")
+
+    scans = []
+    if args.mongo_uri:
+        scans = check_query_plans(client[database.DB_NAME])
+        for name, query in scans:
+            print(f"COLLSCAN on {name}: {query}")
+        if not scans:
+            print("Query plans: every checked lookup uses an index")
+        cleanup_data(client)
+    else:
+        print("Query plans: not checked (mongomock has no explain, use --mongo-uri)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "args": vars(args),
+                "wall_seconds": wall,
+                "errors": errors,
+                "collscans": [[name, query] for name, query in scans],
+                "analytics_mismatches": mismatches,
+                "pages": summary,
+            }, f, indent=2)
+    if errors or scans or mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import re
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional, fall back to ~4 characters per token
+    _ENCODING = None
+
+DEFAULT_TOKEN_BUDGET = 6000
+# share of the budget reserved for the compressed summary of older turns
+SUMMARY_SHARE = 0.25
+ANSWER_SNIPPET_CHARS = 240
+# per-message overhead of the chat format
+MESSAGE_OVERHEAD = 4
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def count_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def first_sentence(text, limit=ANSWER_SNIPPET_CHARS):
+    text = " ".join(text.split())
+    text = _SENTENCE_END.split(text, maxsplit=1)[0]
+    if len(text) > limit:
+        text = text[:limit].rsplit(" ", 1)[0] + "…"
+    return text
+
+
+def summarize_turns(messages, budget):
+    """Compress older turns into one system message, newest lines first until the budget runs out."""
+    lines = []
+    used = count_tokens("Earlier in this conversation:\n")
+    for msg in reversed(messages):
+        if msg["role"] == "user":
+            line = f"- The reader asked: {' '.join(msg['content'].split())}"
+        else:
+            line = f"- You answered: {first_sentence(msg['content'])}"
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return None
+    return {
+        "role": "system",
+        "content": "Earlier in this conversation:\n" + "\n".join(reversed(lines)),
+    }
+
+
+def build_chat_context(prefix, messages, budget=DEFAULT_TOKEN_BUDGET):
+    """Fit a conversation into `budget` tokens.
+
+    `prefix` (system prompt + abstract) is always sent verbatim, the most recent
+    turns are kept verbatim while they fit, and anything older is compressed
+    into a short running summary. The latest message is always kept.
+    """
+    used = sum(message_tokens(m) for m in prefix)
+    summary_budget = int(budget * SUMMARY_SHARE)
+    recent_budget = budget - used - summary_budget
+
+    recent = []
+    for msg in reversed(messages):
+        cost = message_tokens(msg)
+        if recent and cost > recent_budget:
+            break
+        # only role/content go to the API, local flags like "cached" are dropped
+        recent.append({"role": msg["role"], "content": msg["content"]})
+        recent_budget -= cost
+    recent.reverse()
+
+    older = messages[:len(messages) - len(recent)]
+    if not older:
+        return list(prefix) + recent
+    # whatever the recent turns left over is also available to the summary
+    summary = summarize_turns(older, summary_budget + max(recent_budget, 0))
+    return list(prefix) + ([summary] if summary else []) + recent
@@ -0,0 +1,68 @@
+import hashlib
+import json
+
+import streamlit as st
+from pymongo import ASCENDING, UpdateOne
+
+from database import get_abstracts_collection
+from repository import SATA_FIELDS
+
+# shared, read-only text for an abstract; stored once in db["abstracts"]
+CONTENT_FIELDS = ["abstract_title", "abstract", "human_written_pls"] + SATA_FIELDS
+
+
+def content_hash(content):
+    """Hash of the source content of an abstract; refreshes skip abstracts whose hash is unchanged."""
+    payload = json.dumps([content.get(k) for k in CONTENT_FIELDS], default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def record_content_hash(record):
+    """content_hash of the copy in an AbstractRecord; computed for copies embedded without one."""
+    if record.content_hash:
+        return record.content_hash
+    return content_hash({
+        "abstract_title": record.abstract_title,
+        "abstract": record.abstract,
+        "human_written_pls": record.human_written_pls,
+        **record.sata,
+    })
+
+
+def build_corpus(prepared):
+    """One content document per abstract_id from prepared assignment rows."""
+    unique = prepared.drop_duplicates("abstract_id", keep="last")
+    corpus = {}
+    for row in unique.to_dict("records"):
+        content = {k: row[k] for k in CONTENT_FIELDS}
+        corpus[row["abstract_id"]] = {"abstract_id": row["abstract_id"], **content, "content_hash": content_hash(content)}
+    return corpus
+
+
+def corpus_ops(corpus):
+    # insert-only: existing content (and its content_hash) is only changed by
+    # `update_mongodb.py refresh`, which also updates the embedded copies
+    return [
+        UpdateOne({"abstract_id": abstract_id}, {"$setOnInsert": content}, upsert=True)
+        for abstract_id, content in corpus.items()
+    ]
+
+
+def upsert_corpus(collection, prepared):
+    corpus = build_corpus(prepared)
+    if not corpus:
+        return 0
+    collection.create_index([("abstract_id", ASCENDING)], unique=True)
+    result = collection.bulk_write(corpus_ops(corpus), ordered=False)
+    return result.upserted_count
+
+
+# the same ~60 abstracts are read by every participant, keep them in process memory;
+# the short ttl bounds how long a server keeps serving text replaced by `update_mongodb.py refresh`
+ABSTRACT_CACHE_TTL = 60
+
+
+@st.cache_data(ttl=ABSTRACT_CACHE_TTL, max_entries=1000)
+def get_abstract_content(abstract_id):
+    doc = get_abstracts_collection().find_one({"abstract_id": str(abstract_id)}, {"_id": 0})
+    return doc or {}
@@ -0,0 +1,84 @@
+import streamlit as st
+from pymongo import ASCENDING, IndexModel, MongoClient
+from pymongo.errors import OperationFailure
+
+from assignments import BATCH_ORDER
+
+# pool defaults, can be overridden in .streamlit/secrets.toml
+DEFAULT_MAX_POOL_SIZE = 100
+DEFAULT_MIN_POOL_SIZE = 0
+DEFAULT_MAX_IDLE_TIME_MS = 300000
+DB_NAME = "pls"
+
+
+def create_mongo_client(uri, max_pool_size=DEFAULT_MAX_POOL_SIZE,
+                        min_pool_size=DEFAULT_MIN_POOL_SIZE,
+                        max_idle_time_ms=DEFAULT_MAX_IDLE_TIME_MS):
+    """Build a pooled client. Used directly by the offline scripts."""
+    return MongoClient(
+        uri,
+        maxPoolSize=max_pool_size,
+        minPoolSize=min_pool_size,
+        maxIdleTimeMS=max_idle_time_ms,
+    )
+
+
+# one client (and one connection pool) per server process, shared by every page and session
+@st.cache_resource
+def get_mongo_client():
+    return create_mongo_client(
+        st.secrets["MONGO_URI"],
+        max_pool_size=int(st.secrets.get("MONGO_MAX_POOL_SIZE", DEFAULT_MAX_POOL_SIZE)),
+        min_pool_size=int(st.secrets.get("MONGO_MIN_POOL_SIZE", DEFAULT_MIN_POOL_SIZE)),
+        max_idle_time_ms=int(st.secrets.get("MONGO_MAX_IDLE_TIME_MS", DEFAULT_MAX_IDLE_TIME_MS)),
+    )
+
+
+def get_db():
+    return get_mongo_client()[DB_NAME]
+
+
+def get_users_collection():
+    return get_db()["users"]
+
+
+def get_abstracts_collection():
+    return get_db()["abstracts"]
+
+
+def index_models():
+    """Indexes every collection in the database should have, by collection name."""
+    users = [
+        # every page filters on prolific_id; unique also stops duplicate first-login inserts
+        IndexModel([("prolific_id", ASCENDING)], unique=True),
+        IndexModel([("last_full_type", ASCENDING)]),
+    ]
+    # admin queries: who finished (or hasn't finished) a given batch
+    for full_type in BATCH_ORDER:
+        phase_type, batch_id = full_type.split("_")
+        users.append(IndexModel([(f"phases.{phase_type}.batches.{batch_id}.completed", ASCENDING)]))
+    return {
+        "users": users,
+        "abstracts": [IndexModel([("abstract_id", ASCENDING)], unique=True)],
+        # versions replaced by `update_mongodb.py refresh`, kept for scoring old answers
+        "abstract_versions": [IndexModel([("content_hash", ASCENDING)], unique=True)],
+        "approved_ids": [IndexModel([("prolific_id_lower", ASCENDING)], unique=True)],
+    }
+
+
+def ensure_indexes(db):
+    """Create any missing indexes. Safe to run repeatedly; problems are reported, not raised."""
+    created = {}
+    for name, models in index_models().items():
+        try:
+            created[name] = db[name].create_indexes(models)
+        except OperationFailure as e:
+            # e.g. duplicate prolific_ids already in the collection
+            print(f"Could not create indexes on {name}: {e}")
+    return created
+
+
+# once per server process
+@st.cache_resource
+def bootstrap_indexes():
+    return ensure_indexes(get_db())
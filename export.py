@@ -0,0 +1,173 @@
+import argparse
+import gzip
+import json
+import os
+import time
+
+from bson import json_util
+
+from assignments import BATCH_ORDER
+from database import DB_NAME, create_mongo_client
+from repository import batch_path
+
+DEFAULT_CURSOR_BATCH = 100
+DEFAULT_CHUNK_ROWS = 5000
+
+# per-abstract tables: table -> {field stored on the embedded abstract: parquet kind}
+# "json" fields stay nested in NDJSON and are written as JSON text in Parquet
+ABSTRACT_TABLES = {
+    "sata": {"sata": "json", "sata_submitted": "bool"},
+    "likert": {"likert": "json", "likert_submitted": "bool"},
+    "term_familiarity": {"term_familarity": "json"},
+    "conversations": {"conversation_log": "json", "summary": "string", "chat_duration_seconds": "float"},
+}
+ABSTRACT_KEYS = {"prolific_id": "string", "full_type": "string", "abstract_id": "string"}
+
+PARTICIPANT_FIELDS = {
+    "prolific_id": "string",
+    "created_at": "timestamp",
+    "accepted_terms": "bool",
+    "last_page": "string",
+    "last_batch": "string",
+    "last_abs_id": "string",
+    "last_full_type": "string",
+    "timestamp": "timestamp",
+}
+
+TABLES = ["participants"] + list(ABSTRACT_TABLES)
+
+
+def abstract_pipeline(fields):
+    """Keep only `fields` of every embedded abstract; chat logs etc. never leave the server otherwise."""
+    project = {"_id": 0, "prolific_id": 1}
+    for full_type in BATCH_ORDER:
+        phase_type, batch_id = full_type.split("_")
+        abstracts = {"$ifNull": [f"${batch_path(phase_type, batch_id)}.abstracts", {}]}
+        project[full_type] = {"$map": {
+            "input": {"$objectToArray": abstracts},
+            "in": {"abstract_id": "$$this.k", **{f: f"$$this.v.{f}" for f in fields}},
+        }}
+    return [{"$project": project}]
+
+
+def abstract_rows(doc, fields):
+    """One row per embedded abstract that has any of `fields` filled in."""
+    for full_type in BATCH_ORDER:
+        for item in doc.get(full_type) or []:
+            if all(item.get(f) in (None, [], {}) for f in fields):
+                continue
+            row = {"prolific_id": doc.get("prolific_id"), "full_type": full_type, "abstract_id": item["abstract_id"]}
+            row.update({f: item.get(f) for f in fields})
+            yield row
+
+
+def table_query(table):
+    """(pipeline, doc -> rows, column kinds) for an output table."""
+    if table == "participants":
+        pipeline = [{"$project": {"_id": 0, **dict.fromkeys(PARTICIPANT_FIELDS, 1)}}]
+        return pipeline, lambda doc: [doc], PARTICIPANT_FIELDS
+    fields = ABSTRACT_TABLES[table]
+    return abstract_pipeline(fields), lambda doc: abstract_rows(doc, fields), {**ABSTRACT_KEYS, **fields}
+
+
+def iter_rows(collection, table, cursor_batch=DEFAULT_CURSOR_BATCH):
+    pipeline, to_rows, _ = table_query(table)
+    # a small batchSize keeps both the client and each getMore reply small
+    for doc in collection.aggregate(pipeline, batchSize=cursor_batch):
+        yield from to_rows(doc)
+
+
+def write_ndjson(rows, path, compress=False):
+    opener = gzip.open if compress else open
+    count = 0
+    with opener(path, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json_util.dumps(row))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def parquet_value(value, kind):
+    if value is None:
+        return None
+    if kind == "json":
+        return json.dumps(value, default=json_util.default, ensure_ascii=False)
+    if kind in ("string", "category"):
+        return str(value)
+    if kind == "float":
+        return float(value)
+    if kind == "int":
+        return int(value)
+    if kind == "bool":
+        return bool(value)
+    if kind == "strings":
+        return [str(v) for v in value]
+    return value
+
+
+def write_parquet(rows, path, columns, compress=False, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write rows in row groups of `chunk_rows`; only one chunk is held in memory."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet export needs pyarrow (pip install pyarrow), or use --format ndjson")
+
+    types = {
+        "string": pa.string(),
+        "json": pa.string(),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "strings": pa.list_(pa.string()),
+        "bool": pa.bool_(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "timestamp": pa.timestamp("ms"),
+    }
+    schema = pa.schema([(name, types[kind]) for name, kind in columns.items()])
+
+    count = 0
+    chunk = {name: [] for name in columns}
+    with pq.ParquetWriter(path, schema, compression="gzip" if compress else "snappy") as writer:
+        for row in rows:
+            for name, kind in columns.items():
+                chunk[name].append(parquet_value(row.get(name), kind))
+            count += 1
+            if count % chunk_rows == 0:
+                writer.write_table(pa.table(chunk, schema=schema))
+                chunk = {name: [] for name in columns}
+        if chunk["prolific_id"]:
+            writer.write_table(pa.table(chunk, schema=schema))
+    return count
+
+
+def export_table(collection, table, out_dir, fmt="ndjson", compress=False,
+                 cursor_batch=DEFAULT_CURSOR_BATCH, chunk_rows=DEFAULT_CHUNK_ROWS):
+    rows = iter_rows(collection, table, cursor_batch)
+    if fmt == "parquet":
+        path = os.path.join(out_dir, f"{table}.parquet")
+        count = write_parquet(rows, path, table_query(table)[2], compress, chunk_rows)
+    else:
+        path = os.path.join(out_dir, f"{table}.ndjson" + (".gz" if compress else ""))
+        count = write_ndjson(rows, path, compress)
+    return path, count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream study results out of the users collection.")
+    parser.add_argument("--out-dir", default="exports")
+    parser.add_argument("--tables", nargs="+", choices=TABLES, default=TABLES)
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="gzip NDJSON files / gzip-compress Parquet pages")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI"))
+    parser.add_argument("--cursor-batch", type=int, default=DEFAULT_CURSOR_BATCH)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows per Parquet row group")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    users_collection = create_mongo_client(args.mongo_uri)[DB_NAME]["users"]
+    for table in args.tables:
+        start = time.time()
+        path, count = export_table(users_collection, table, args.out_dir, args.format, args.gzip,
+                                   args.cursor_batch, args.chunk_rows)
+        print(f"{table}: {count} rows -> {path} ({time.time() - start:.1f}s)")
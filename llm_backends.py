@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import random
+
+from openai import AsyncOpenAI
+
+STUB_WORDS = (
+    "this study looked at how a treatment works in people and what the researchers found "
+    "the results suggest that the approach may help but more research is needed before "
+    "doctors can be sure it is safe and useful for everyone who might need it"
+).split()
+
+
+class TransientLLMError(Exception):
+    """A failure worth retrying (the stub's simulated overload)."""
+
+
+class OpenAIBackend:
+    """Chat completions from the OpenAI API."""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.client = None
+
+    async def start(self):
+        # the async client binds to the loop it is created on; retries are the gateway's, not the SDK's
+        self.client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+
+    async def complete(self, messages, model):
+        response = await self.client.chat.completions.create(model=model, messages=messages)
+        return response.choices[0].message.content.strip()
+
+    async def stream(self, messages, model):
+        stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubBackend:
+    """Offline stand-in that returns canned text with LLM-like timing.
+
+    Each reply waits `latency` seconds before the first token, then emits
+    `tokens` words at `tokens_per_second`. The text depends only on the
+    messages, so repeated runs are reproducible. `error_rate` makes that
+    share of calls fail with a retryable error.
+    """
+
+    def __init__(self, latency=0.8, tokens_per_second=50.0, tokens=120, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    async def start(self):
+        pass
+
+    def reply(self, messages):
+        digest = hashlib.sha1(repr([(m["role"], m["content"]) for m in messages]).encode()).digest()
+        offset = int.from_bytes(digest[:4], "big")
+        words = [STUB_WORDS[(offset + i) % len(STUB_WORDS)] for i in range(self.tokens)]
+        return " ".join(words).capitalize() + "."
+
+    async def _words(self, messages):
+        await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise TransientLLMError("stub backend overloaded")
+        words = self.reply(messages).split(" ")
+        delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for i, word in enumerate(words):
+            if delay:
+                await asyncio.sleep(delay)
+            yield word if i == 0 else " " + word
+
+    async def complete(self, messages, model):
+        return "".join([word async for word in self._words(messages)])
+
+    async def stream(self, messages, model):
+        async for word in self._words(messages):
+            yield word
+
+
+def create_backend(name, secrets):
+    """Backend selected by LLM_BACKEND ("openai" or "stub")."""
+    if name == "stub":
+        return StubBackend(
+            latency=float(secrets.get("LLM_STUB_LATENCY", 0.8)),
+            tokens_per_second=float(secrets.get("LLM_STUB_TOKENS_PER_SEC", 50)),
+            tokens=int(secrets.get("LLM_STUB_TOKENS", 120)),
+            error_rate=float(secrets.get("LLM_STUB_ERROR_RATE", 0.0)),
+        )
+    if name == "openai":
+        return OpenAIBackend(api_key=secrets["OPENAI_API_KEY"])
+    raise ValueError(f"Unknown LLM_BACKEND: {name!r}")
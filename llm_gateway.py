@@ -0,0 +1,188 @@
+import asyncio
+import concurrent.futures
+import queue
+import random
+import threading
+import time
+
+import streamlit as st
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+from llm_backends import TransientLLMError, create_backend
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# the loop enforces each deadline; the callers' own bound only catches a stalled loop
+DEADLINE_GRACE = 1.0
+
+_DONE = object()
+
+
+class LLMUnavailable(Exception):
+    """Raised when a completion could not be produced before its deadline."""
+
+
+def is_retryable(e):
+    if isinstance(e, (RateLimitError, APITimeoutError, APIConnectionError, asyncio.TimeoutError, TransientLLMError)):
+        return True
+    return isinstance(e, APIStatusError) and e.status_code >= 500
+
+
+class LLMGateway:
+    """Process-wide access point for chat completions.
+
+    Runs an async backend (OpenAI or the offline stub, see llm_backends) on
+    its own event loop thread, caps concurrent completions across every
+    session with a semaphore, gives each call a deadline and retries
+    429/5xx/timeouts with jittered exponential backoff.
+    The blocking `complete` / `stream` wrappers are safe to call from
+    Streamlit script threads and from background workers.
+    """
+
+    def __init__(self, backend, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-gateway", daemon=True)
+        self.thread.start()
+        self.backend = backend
+        self._call(backend.start())
+        self.semaphore = self._call(self._make_semaphore())
+
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrency)
+
+    def _call(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def _count(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "queue_depth": self.waiting,
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "completed": self.completed,
+                "failed": self.failed,
+                "retries": self.retries,
+            }
+
+    async def _with_retries(self, attempt_fn, deadline):
+        self._count(waiting=1)
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self._count(waiting=-1, failed=1)
+            raise LLMUnavailable("timed out waiting for a free completion slot")
+        except asyncio.CancelledError:
+            self._count(waiting=-1)
+            raise
+        self._count(waiting=-1, in_flight=1)
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    result = await asyncio.wait_for(attempt_fn(), remaining)
+                    self._count(completed=1)
+                    return result
+                except Exception as e:
+                    attempt += 1
+                    # full jitter keeps a rate-limit storm from retrying in lockstep
+                    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                    if not is_retryable(e) or attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                        self._count(failed=1)
+                        raise LLMUnavailable(repr(e)) from e
+                    self._count(retries=1)
+                    await asyncio.sleep(delay)
+        finally:
+            self._count(in_flight=-1)
+            self.semaphore.release()
+
+    async def _complete(self, messages, model, deadline):
+        return await self._with_retries(lambda: self.backend.complete(messages, model), deadline)
+
+    async def _stream(self, messages, model, deadline, out):
+        started = False
+
+        async def attempt():
+            nonlocal started
+            async for text in self.backend.stream(messages, model):
+                started = True
+                out.put(text)
+
+        async def guarded():
+            try:
+                await attempt()
+            except Exception as e:
+                # once tokens reached the participant a retry would duplicate them
+                if started:
+                    raise LLMUnavailable(repr(e)) from e
+                raise
+
+        try:
+            await self._with_retries(guarded, deadline)
+            out.put(_DONE)
+        except Exception as e:
+            out.put(e)
+
+    def complete(self, messages, model="gpt-4o", timeout=None):
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, model, deadline), self.loop)
+        try:
+            return future.result(timeout + DEADLINE_GRACE)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise LLMUnavailable("completion did not finish before its deadline")
+
+    def stream(self, messages, model="gpt-4o", timeout=None):
+        """Yield text deltas as they arrive (usable with st.write_stream).
+
+        Closing the generator early (a Streamlit rerun mid-stream) cancels
+        the completion, so its concurrency slot is released right away.
+        """
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        out = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._stream(messages, model, deadline, out), self.loop)
+        try:
+            while True:
+                try:
+                    item = out.get(timeout=max(deadline - time.monotonic(), 0) + DEADLINE_GRACE)
+                except queue.Empty:
+                    raise LLMUnavailable("stream did not finish before its deadline")
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+
+# one gateway (event loop, client and concurrency limit) per server process
+@st.cache_resource
+def get_llm_gateway():
+    return LLMGateway(
+        backend=create_backend(st.secrets.get("LLM_BACKEND", "openai"), st.secrets),
+        max_concurrency=int(st.secrets.get("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+        timeout=float(st.secrets.get("LLM_TIMEOUT", DEFAULT_TIMEOUT)),
+        max_retries=int(st.secrets.get("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+    )
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+
+from pymongo import UpdateOne
+
+DEFAULT_BATCH_SIZE = 500
+CHECKPOINT_DIR = ".migrations"
+# how many paths of one operation a dry run prints
+DIFF_PATH_LIMIT = 25
+DIFF_VALUE_CHARS = 80
+
+
+@dataclass
+class MigrationOp:
+    # unique per op; ops run sorted by key and a checkpoint stores the last key written
+    key: str
+    filter: dict
+    update: dict
+    upsert: bool = False
+
+
+def checkpoint_path(name, checkpoint_dir=CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, f"{name}.json")
+
+
+def load_checkpoint(name, checkpoint_dir=CHECKPOINT_DIR):
+    try:
+        with open(checkpoint_path(name, checkpoint_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(name, state, checkpoint_dir=CHECKPOINT_DIR):
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = checkpoint_path(name, checkpoint_dir)
+    # write then rename, so an interrupted run never leaves half a checkpoint
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def clear_checkpoint(name, checkpoint_dir=CHECKPOINT_DIR):
+    try:
+        os.remove(checkpoint_path(name, checkpoint_dir))
+    except FileNotFoundError:
+        pass
+
+
+def ops_fingerprint(ops):
+    """sha1 of the whole op list, so a checkpoint is only resumed for the same changes."""
+    payload = [[op.key, op.filter, op.update, op.upsert] for op in ops]
+    return hashlib.sha1(json.dumps(payload, default=str, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def short_value(value):
+    text = json.dumps(value, default=str, ensure_ascii=False)
+    if len(text) > DIFF_VALUE_CHARS:
+        text = text[:DIFF_VALUE_CHARS] + "…"
+    return text
+
+
+def print_diff(op):
+    lines = [f"  - {path}" for path in op.update.get("$unset", {})]
+    values = {**op.update.get("$setOnInsert", {}), **op.update.get("$set", {})}
+    lines += [f"  + {path} = {short_value(v)}" for path, v in values.items()]
+    print(f"\n[{op.key}] {len(lines)} change(s)")
+    for line in lines[:DIFF_PATH_LIMIT]:
+        print(line)
+    if len(lines) > DIFF_PATH_LIMIT:
+        print(f"  ... +{len(lines) - DIFF_PATH_LIMIT} more")
+
+
+def run_migration(name, collection, ops, batch_size=DEFAULT_BATCH_SIZE, dry_run=False,
+                  resume=True, checkpoint_dir=CHECKPOINT_DIR, fingerprint=None):
+    """Send `ops` (MigrationOp) to `collection` in ordered bulk_write batches.
+
+    After every batch the last key written is checkpointed under `name`; a
+    rerun skips everything up to it. $set/$unset are idempotent, so a batch
+    that failed half way is simply sent again. Dry runs print the diff and
+    write nothing, checkpoint included.
+
+    The checkpoint also stores `fingerprint` (by default ops_fingerprint of
+    the full op list) and is only resumed when it matches. Pass the hash of
+    the source instead when the ops shrink as the migration progresses.
+    """
+    ops = sorted(ops, key=lambda op: op.key)
+    fingerprint = fingerprint or ops_fingerprint(ops)
+    checkpoint = load_checkpoint(name, checkpoint_dir) if resume else None
+    if checkpoint:
+        if checkpoint.get("fingerprint") != fingerprint:
+            raise SystemExit(
+                f"[{name}] {checkpoint_path(name, checkpoint_dir)} was left by a run with different changes "
+                "(the sheet or the options changed since); rerun with --restart to start over"
+            )
+        ops = [op for op in ops if op.key > checkpoint["last_key"]]
+        print(f"[{name}] resuming after {checkpoint['last_key']!r} ({checkpoint['written']} ops already written)")
+
+    stats = {"ops": len(ops), "batches": 0, "matched": 0, "modified": 0, "upserted": 0, "seconds": 0.0}
+    if dry_run:
+        for op in ops:
+            print_diff(op)
+        print(f"\n[{name}] DRY_RUN: {len(ops)} op(s) in {-(-len(ops) // batch_size)} batch(es) not sent")
+        return stats
+
+    written = checkpoint["written"] if checkpoint else 0
+    start = time.time()
+    for i in range(0, len(ops), batch_size):
+        batch = ops[i:i + batch_size]
+        result = collection.bulk_write(
+            [UpdateOne(op.filter, op.update, upsert=op.upsert) for op in batch], ordered=True
+        )
+        written += len(batch)
+        stats["batches"] += 1
+        stats["matched"] += result.matched_count
+        stats["modified"] += result.modified_count
+        stats["upserted"] += result.upserted_count
+        save_checkpoint(name, {"last_key": batch[-1].key, "written": written, "fingerprint": fingerprint}, checkpoint_dir)
+
+        elapsed = time.time() - start
+        done = i + len(batch)
+        print(f"[{name}] {done}/{len(ops)} ops, {done / elapsed:.0f} ops/s, {elapsed:.1f}s")
+
+    stats["seconds"] = time.time() - start
+    clear_checkpoint(name, checkpoint_dir)
+    return stats
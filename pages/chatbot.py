@@ -1,9 +1,15 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import get_users_collection, get_abstracts_collection
+from repository import ParticipantRepository
+from corpus import get_abstract_content
+from sata import get_sata_questions
+from summary_jobs import get_summary_jobs
+from chat_context import DEFAULT_TOKEN_BUDGET, build_chat_context
+from answer_cache import cache_key, get_answer_cache
+from llm_gateway import LLMUnavailable, get_llm_gateway
 import time
 from datetime import datetime
 import pandas as pd
-from openai import OpenAI
 import streamlit.components.v1 as components
 import sys
 from navigation import render_nav
@@ -32,18 +38,19 @@ st.markdown(
 )
 st.set_page_config(layout="wide")
 
-@st.cache_resource
-def get_mongo_client():
-    return MongoClient(st.secrets["MONGO_URI"])
+# stream chatbot answers token by token, set CHAT_STREAMING = false in secrets to disable
+CHAT_STREAMING = st.secrets.get("CHAT_STREAMING", True)
+# token budget for each chatbot request (system prompt + abstract + conversation)
+CHAT_CONTEXT_TOKENS = int(st.secrets.get("CHAT_CONTEXT_TOKENS", DEFAULT_TOKEN_BUDGET))
+# opt-in: reuse answers to identical questions on the same abstract (hits are flagged in conversation_log)
+CHAT_ANSWER_CACHE = st.secrets.get("CHAT_ANSWER_CACHE", False)
+# deadline for the personalized summary rewrite, which is much longer than a chat answer
+SUMMARY_TIMEOUT = float(st.secrets.get("LLM_SUMMARY_TIMEOUT", 120))
 
-@st.cache_resource
-def get_openai_client():
-    return OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-
-db = get_mongo_client()["pls"]
-users_collection = db["users"]
-abstracts_collection = db["abstracts"]
-client_openai = get_openai_client()
+users_collection = get_users_collection()
+abstracts_collection = get_abstracts_collection()
+participants = ParticipantRepository(users_collection, cache=st.session_state, content=get_abstract_content)
+llm = get_llm_gateway()
 
 @st.cache_data
 def load_example_users():
@@ -160,8 +167,8 @@ def interactive_instructions(prolific_id, batch_id):
 
     if st.button("Start"):
         st.session_state.seen_interactive_instructions = True
-        users_collection.update_one(
-            {"prolific_id": prolific_id},
+        participants.update(
+            prolific_id,
             {"$set": {f"phases.interactive.batches.{batch_id}.seen_instructions": True}},
             upsert=True
         )
@@ -191,65 +198,23 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def get_next_incomplete_abstract(prolific_id: str, batch_id: str):
-    user = users_collection.find_one(
-        {"prolific_id": prolific_id},
-        {f"phases.interactive.batches.{batch_id}.abstracts": 1, "_id": 0}
-    )
-
-    if not user:
+    record = participants.get_next_incomplete_abstract(prolific_id, "interactive", batch_id)
+    if record is None:
         return None
-
-    abstracts = (
-        user.get("phases", {})
-            .get("interactive", {})
-            .get("batches", {})
-            .get(batch_id, {})
-            .get("abstracts", {})
-    )
-
-    print("DEBUG abstracts keys:", abstracts.keys())
-    for abstract_id in sorted(abstracts.keys(), key=lambda x: int(x)):
-        a = abstracts[abstract_id]
-        if not a.get("completed", False):
-            return {
-                "abstract_id": abstract_id,
-                "abstract": a.get("abstract", ""),
-                "abstract_title": a.get("abstract_title", "")
-            }
-    return None
-
-# get all the interactive abstracts in the batch
-def get_user_interactive_abstracts(prolific_id: str, batch_id: str):
-    user = users_collection.find_one(
-        {"prolific_id": prolific_id},
-        {f"phases.interactive.batches.{batch_id}.abstracts": 1, "_id": 0}
-    )
-    if not user:
-        return []
-
-    abstracts_dict = (
-        user.get("phases", {})
-            .get("interactive", {})
-            .get("batches", {})
-            .get(batch_id, {})
-            .get("abstracts", {})
-    )
-    abstracts = []
-    for abstract_id, data in abstracts_dict.items():
-        abstracts.append({
-            "abstract_id": abstract_id,
-            "abstract_title": data.get("abstract_title", ""),
-            "abstract": data.get("abstract", "")
-        })
-    return abstracts
+    return {
+        "abstract_id": record.abstract_id,
+        "abstract": record.abstract,
+        "abstract_title": record.abstract_title
+    }
 
 def format_sata(sata_list):
     out = []
     for i, q in enumerate(sata_list, 1):
-        out.append(f"SATA {i}: {q['question']}")
-        for j, opt in enumerate(q["options"], 1):
+        out.append(f"SATA {i}: {q.text}")
+        for j, opt in enumerate(q.choices, 1):
             out.append(f"  {j}. {opt}")
-        out.append(f"Correct answers: {', '.join(q['correct_answers'])}")
+        # as written in the sheet, so an answer that matches no choice label still reaches the prompt
+        out.append(f"Correct answers: {', '.join(q.correct_answers)}")
         out.append("")
     return "\n".join(out)
 
@@ -265,33 +230,91 @@ def build_conversation_text(conversation_log):
 
     return "\n".join(f"User: {q}" for q in user_messages)
 
-def parse_choices(s):
-    if not s:
-        return []
-    return [x.strip() for x in str(s).split(";") if x.strip()]
-
-def build_sata_questions(abstract_info):
-    sata_questions = []
+def build_sata_questions(record):
     allowed_questions = {1, 2, 3, 5}
-
-    for i in allowed_questions:
-        q_key = f"question_{i}"
-        choices_key = f"question_{i}_answers_choices"
-        correct_key = f"question_{i}_correct_answers"
-        if q_key not in abstract_info:
-            continue
-
-        sata_questions.append({
-            "question": abstract_info[q_key],
-            "options": parse_choices(abstract_info.get(choices_key, "")),
-            "correct_answers": parse_choices(abstract_info.get(correct_key, "")),
-        })
+    sata_questions = [
+        q for q in get_sata_questions(record.abstract_id, record.sata)
+        if q.number in allowed_questions
+    ]
 
     if not sata_questions:
         raise ValueError("No valid SATA questions found after filtering")
 
     return sata_questions
 
+def generate_summary(abstract, conversation_text, sata_text):
+    system_prompt = (
+        "CRITICAL RULE:\n"
+        "If the user asks 'why' or 'how' and the abstract does not explicitly explain the reason or mechanism, you MUST say so directly "
+            "(e.g., 'The abstract does not explain why/how X; it only states that X was done.'). After this admission, you MUST provide a "
+        "best-guess explanation using your internal background knowledge. Clearly label this as inference or general context (e.g., 'In a "
+        "broader statistical context, this often means...') to distinguish it from the abstract's claims.\n\n"
+        "You are an expert science communicator.\n\n"
+        "Your task is to rewrite the abstract into a personalized, plain-language summary for this specific reader.\n\n"
+        "You MUST use the questions the user is confused about below—specifically the query regarding the Bayesian framework—to ensure "
+        "those concepts are demystified in the narrative.\n\n"
+        f"Questions:\n{conversation_text}\n\n"
+        f"Select-All-That-Apply (SATA) Questions:\n{sata_text}\n\n"
+        "For each SATA item:\n"
+        "- The rewritten summary MUST contain information that allows a careful reader to logically deduce every correct answer.\n"
+        "- You must NOT explicitly list, label, or reference answer choices or say which options are correct inside the summary.\n"
+        "- The summary MUST avoid adding statements that would also justify incorrect options.\n"
+        "- You MUST include background knowledge for any technical term (like 'Bayesian' or 'HbA1c') mentioned in the user's questions, even if the abstract is silent on the details.\n"
+        "- The summary must remain natural narrative, not exam-style reasoning.\n\n"
+        "Final output rules:\n"
+        "- Output only the final personalized plain-language summary.\n"
+        "- The summary MUST be written in coherent paragraph form.\n"
+        "- Do NOT use bullet points, lists, headings, or numbered items.\n"
+        "- LENGTH CONSTRAINT: The rewritten summary MUST have approximately the same number of sentences as the original abstract (±1 sentence).\n"
+    )
+
+    return llm.complete(
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Rewrite this abstract:\n\n{abstract}"},
+        ],
+        model="gpt-4o",
+        timeout=SUMMARY_TIMEOUT,
+    )
+
+def start_summary_job(prolific_id, batch_id, abstract_id, abstract):
+    """Speculatively generate the summary for the conversation so far."""
+    try:
+        conversation_text = build_conversation_text(st.session_state.messages)
+        abstract_info = participants.get_abstract(prolific_id, "interactive", batch_id, str(abstract_id))
+        sata_text = format_sata(build_sata_questions(abstract_info))
+    except ValueError:
+        return
+    get_summary_jobs().submit(
+        (prolific_id, batch_id, str(abstract_id)),
+        conversation_text,
+        generate_summary, abstract, conversation_text, sata_text,
+    )
+
+def generate_answer(abstract):
+    """Answer the latest question, streaming it into the current container."""
+    # abstract + recent turns verbatim, older turns compressed to stay within budget
+    conversation_context = build_chat_context(
+        [
+            {"role": "system", "content": (
+                "You are a helpful assistant explaining scientific abstracts clearly and accurately. "
+                "Use the abstract below to provide detailed but easy-to-understand answers."
+            )},
+            {"role": "system", "content": f"Abstract:\n{abstract}"},
+        ],
+        st.session_state.messages,
+        budget=CHAT_CONTEXT_TOKENS,
+    )
+
+    if CHAT_STREAMING:
+        # render tokens as they arrive instead of a blank spinner
+        full_response = st.write_stream(llm.stream(conversation_context, model="gpt-4o")).strip()
+    else:
+        with st.spinner("🤔 Thinking..."):
+            full_response = llm.complete(conversation_context, model="gpt-4o")
+            st.markdown(full_response)
+    return full_response
+
 def run_chatbot(prolific_id, batch_id, full_type):
     # detect batch change 
     if st.session_state.get("current_batch_id") != batch_id:
@@ -332,14 +355,7 @@ def run_chatbot(prolific_id, batch_id, full_type):
     abstract_id = abstract_dict["abstract_id"]
     abstract_title = abstract_dict["abstract_title"]
     abstract = abstract_dict["abstract"]
-    user = users_collection.find_one({"prolific_id": prolific_id})
-    db_seen = (
-        user.get("phases", {})
-            .get("interactive", {})
-            .get("batches", {})
-            .get(batch_id, {})
-            .get("seen_instructions", False)
-    )
+    db_seen = participants.get_seen_instructions(prolific_id, "interactive", batch_id)
     if "seen_interactive_instructions" not in st.session_state:
         st.session_state.seen_interactive_instructions = db_seen
     if not st.session_state.seen_interactive_instructions:
@@ -354,20 +370,9 @@ def run_chatbot(prolific_id, batch_id, full_type):
             st.session_state.show_logout_dialog = False 
             logout_confirm_dialog(prolific_id)
 
-    user = users_collection.find_one(
-    {"prolific_id": prolific_id},
-    {f"phases.interactive.batches.{batch_id}.abstracts": 1, "_id": 0}
-    )
-
-    abstracts_dict = (
-        user.get("phases", {})
-            .get("interactive", {})
-            .get("batches", {})
-            .get(batch_id, {})
-            .get("abstracts", {})
-    )
-    total = len(abstracts_dict)
-    completed = sum(1 for a in abstracts_dict.values() if a.get("completed", False))
+    progress = participants.get_batch_progress(prolific_id, "interactive", batch_id)
+    total = progress.total
+    completed = progress.completed
     current = completed
     progress_ratio = current / total if total > 0 else 0
     st.progress(progress_ratio)
@@ -426,6 +431,8 @@ def run_chatbot(prolific_id, batch_id, full_type):
     with col2:
         if not st.session_state.get("show_summary", False) and not st.session_state.get("generating_summary", False):
             st.markdown("### 💬 Chat with the Chatbot")
+            if st.session_state.pop("summary_failed", False):
+                st.error("The SUMMARY could not be generated right now. Please click \"I'm done asking questions\" again in a moment.")
             messages = st.container(height=550, border=True)
             for msg in st.session_state.messages:
                 messages.chat_message(msg["role"]).write(msg["content"])
@@ -435,25 +442,38 @@ def run_chatbot(prolific_id, batch_id, full_type):
                     st.session_state.messages.append({"role": "user", "content": prompt})
                     st.session_state.question_count += 1
                     messages.chat_message("user").write(prompt)
+                    # summary only depends on the questions, start it while the answer streams
+                    if st.session_state.question_count >= 3:
+                        start_summary_job(prolific_id, batch_id, abstract_id, abstract)
 
                     with messages.chat_message("assistant"):
-                        with st.spinner("🤔 Thinking..."):
-                            conversation_context = [
-                                {"role": "system", "content": (
-                                    "You are a helpful assistant explaining scientific abstracts clearly and accurately. "
-                                    "Use the abstract below to provide detailed but easy-to-understand answers."
-                                )},
-                                {"role": "system", "content": f"Abstract:\n{abstract}"},
-                            ] + st.session_state.messages
-
-                            response = client_openai.chat.completions.create(
-                                model="gpt-4o",
-                                messages=conversation_context,
-                            )
-                            full_response = response.choices[0].message.content.strip()
-
-                            st.session_state.messages.append({"role": "assistant", "content": full_response})
+                        answer_key = None
+                        cached_response = None
+                        if CHAT_ANSWER_CACHE:
+                            answer_key = cache_key(abstract_id, st.session_state.messages[:-1], prompt)
+                            cached_response = get_answer_cache().get(answer_key)
+
+                        if cached_response is not None:
+                            full_response = cached_response
                             st.markdown(full_response)
+                        else:
+                            try:
+                                full_response = generate_answer(abstract)
+                            except LLMUnavailable as e:
+                                print(">>>> chatbot answer failed:", e, llm.metrics(), file=sys.stderr)
+                                # drop the unanswered question so the participant can simply ask again
+                                st.session_state.messages.pop()
+                                st.session_state.question_count -= 1
+                                st.error("The chatbot is busy right now. Please ask your question again in a moment.")
+                                st.stop()
+                            if answer_key is not None:
+                                get_answer_cache().put(answer_key, full_response)
+
+                        st.session_state.messages.append({
+                            "role": "assistant",
+                            "content": full_response,
+                            "cached": cached_response is not None,
+                        })
 
             # "I'm done asking" button
             done_disabled = st.session_state.question_count < 3
@@ -485,11 +505,11 @@ def run_chatbot(prolific_id, batch_id, full_type):
 
             if done_clicked and not done_disabled:
                 conversation_log = [
-                    {"role": m["role"], "content": m["content"], "timestamp": datetime.utcnow()}
+                    {"role": m["role"], "content": m["content"], "timestamp": datetime.utcnow(), "cached": m.get("cached", False)}
                     for m in st.session_state.messages
                 ]
-                users_collection.update_one(
-                    {"prolific_id": prolific_id},
+                participants.update(
+                    prolific_id,
                     {"$set": {
                         f"phases.interactive.batches.{batch_id}.abstracts.{abstract_id}.conversation_log": conversation_log
                     }},
@@ -498,63 +518,32 @@ def run_chatbot(prolific_id, batch_id, full_type):
 
         elif st.session_state.get("generating_summary", False):
             with st.spinner(""):
-                doc = users_collection.find_one(
-                    {"prolific_id": prolific_id},
-                    {f"phases.interactive.batches.{batch_id}.abstracts": 1, "_id": 0}
-                )
-
                 abstract_key = str(abstract_id)
-                abstracts_dict = (
-                    doc.get("phases", {})
-                    .get("interactive", {})
-                    .get("batches", {})
-                    .get(batch_id, {})
-                    .get("abstracts", {})
-                )
-                conversation_log = (
-                    abstracts_dict
-                        .get(abstract_key, {})
-                        .get("conversation_log", [])
+                conversation_log = participants.get_conversation_log(
+                    prolific_id, "interactive", batch_id, abstract_key
                 )
                 conversation_text = build_conversation_text(conversation_log)
                 print(conversation_text)
-                abstract_info = abstracts_dict.get(abstract_key, {})
+                abstract_info = participants.get_abstract(
+                    prolific_id, "interactive", batch_id, abstract_key
+                )
                 sata_list = build_sata_questions(abstract_info)
                 sata_text = format_sata(sata_list)
                 print(sata_text)
-                system_prompt = (
-                    "CRITICAL RULE:\n"
-                    "If the user asks 'why' or 'how' and the abstract does not explicitly explain the reason or mechanism, you MUST say so directly "
-                        "(e.g., 'The abstract does not explain why/how X; it only states that X was done.'). After this admission, you MUST provide a "
-                    "best-guess explanation using your internal background knowledge. Clearly label this as inference or general context (e.g., 'In a "
-                    "broader statistical context, this often means...') to distinguish it from the abstract's claims.\n\n"
-                    "You are an expert science communicator.\n\n"
-                    "Your task is to rewrite the abstract into a personalized, plain-language summary for this specific reader.\n\n"
-                    "You MUST use the questions the user is confused about below—specifically the query regarding the Bayesian framework—to ensure "
-                    "those concepts are demystified in the narrative.\n\n"
-                    f"Questions:\n{conversation_text}\n\n"
-                    f"Select-All-That-Apply (SATA) Questions:\n{sata_text}\n\n"
-                    "For each SATA item:\n"
-                    "- The rewritten summary MUST contain information that allows a careful reader to logically deduce every correct answer.\n"
-                    "- You must NOT explicitly list, label, or reference answer choices or say which options are correct inside the summary.\n"
-                    "- The summary MUST avoid adding statements that would also justify incorrect options.\n"
-                    "- You MUST include background knowledge for any technical term (like 'Bayesian' or 'HbA1c') mentioned in the user's questions, even if the abstract is silent on the details.\n"
-                    "- The summary must remain natural narrative, not exam-style reasoning.\n\n"
-                    "Final output rules:\n"
-                    "- Output only the final personalized plain-language summary.\n"
-                    "- The summary MUST be written in coherent paragraph form.\n"
-                    "- Do NOT use bullet points, lists, headings, or numbered items.\n"
-                    "- LENGTH CONSTRAINT: The rewritten summary MUST have approximately the same number of sentences as the original abstract (±1 sentence).\n"
-                )
-
-                response = client_openai.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Rewrite this abstract:\n\n{abstract}"},
-                    ],
+                # usually already generated in the background while the participant was chatting
+                summary = get_summary_jobs().pop_result(
+                    (prolific_id, batch_id, abstract_key), conversation_text
                 )
-                summary = response.choices[0].message.content.strip()
+                if summary is None:
+                    try:
+                        summary = generate_summary(abstract, conversation_text, sata_text)
+                    except LLMUnavailable as e:
+                        print(">>>> summary failed:", e, llm.metrics(), file=sys.stderr)
+                        # back to the chat, the done button is the retry
+                        st.session_state.generating_summary = False
+                        st.session_state.dialog_generating = False
+                        st.session_state.summary_failed = True
+                        st.rerun()
                 st.session_state.generated_summary = summary
                 st.session_state.generating_summary = False
                 st.session_state.dialog_generating = False
@@ -572,8 +561,8 @@ def run_chatbot(prolific_id, batch_id, full_type):
                     "current": current,
                     "total": total
                 }
-                users_collection.update_one(
-                    {"prolific_id": prolific_id},
+                participants.update(
+                    prolific_id,
                     {"$set": {
                         f"phases.interactive.batches.{batch_id}.abstracts.{abstract_id}.summary": summary,
                         f"phases.interactive.batches.{batch_id}.abstracts.{abstract_id}.chat_duration_seconds": st.session_state.chat_duration_seconds
@@ -592,8 +581,8 @@ def run_chatbot(prolific_id, batch_id, full_type):
                 ]:
                     if key in st.session_state:
                         st.session_state.pop(key)
-                users_collection.update_one(
-                    {"prolific_id": prolific_id},
+                participants.update(
+                    prolific_id,
                     {"$set": {
                         "last_page": "chatbot",
                         "last_batch": batch_id,
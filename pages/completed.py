@@ -1,19 +1,14 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import get_users_collection
+from repository import ParticipantRepository
 from datetime import datetime
 from navigation import render_nav
 
 
 
-@st.cache_resource
-def get_mongo_client():
-    return MongoClient(st.secrets["MONGO_URI"])
-
-# connect to MongoDB
-MONGO_URI = st.secrets["MONGO_URI"]
-client = MongoClient(MONGO_URI)
-db = client["pls"]
-users_collection = db["users"]
+# connect to MongoDB through the shared pooled client
+users_collection = get_users_collection()
+participants = ParticipantRepository(users_collection, cache=st.session_state)
 
 @st.dialog("Are you sure you want to log out?", dismissible=False)
 def logout_confirm_dialog(prolific_id):
@@ -26,8 +21,8 @@ def logout_confirm_dialog(prolific_id):
     with col2:
         if st.button("Logout"):
             st.session_state.show_logout_dialog = False
-            users_collection.update_one(
-                {"prolific_id": prolific_id},
+            participants.update(
+                prolific_id,
                 {"$set": {
                     "phases.interactive.last_completed_index":
                         st.session_state.get("abstract_index", 0)
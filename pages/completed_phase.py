@@ -1,5 +1,6 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import get_users_collection
+from repository import ParticipantRepository
 from datetime import datetime, timezone
 
 st.set_page_config(layout="wide")
@@ -47,12 +48,10 @@ if st.button("Submit answer"):
         st.error("Please make a selection to continue.")
         st.stop()
 
-    client = MongoClient(st.secrets["MONGO_URI"])
-    db = client["pls"]
-    users_collection = db["users"]
+    participants = ParticipantRepository(get_users_collection(), cache=st.session_state)
 
-    users_collection.update_one(
-        {"prolific_id": prolific_id},
+    participants.update(
+        prolific_id,
         {"$set": {
             f"phases.static.batches.{batch_id}.confirmed_completion": choice.startswith("Yes"),
             "timestamp": datetime.now(timezone.utc)
@@ -1,5 +1,8 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import get_users_collection
+from repository import ParticipantRepository
+from corpus import get_abstract_content, record_content_hash
+from sata import get_sata_questions
 from datetime import datetime
 import sys
 from navigation import render_nav
@@ -17,18 +20,9 @@ st.markdown(
 )
 
 st.set_page_config(layout="wide")
-@st.cache_resource
-def get_mongo_client():
-    return MongoClient(st.secrets["MONGO_URI"])
-
-# connect to MongoDB
-MONGO_URI = st.secrets["MONGO_URI"]
-client = MongoClient(MONGO_URI)
-db = client["pls"]
-users_collection = db["users"]
-
-def parse_choices(s):
-    return [x.strip() for x in s.split(";") if x.strip()]
+# connect to MongoDB through the shared pooled client
+users_collection = get_users_collection()
+participants = ParticipantRepository(users_collection, cache=st.session_state, content=get_abstract_content)
 
 def accumulate_question_time():
     """Add elapsed time to the current question."""
@@ -77,9 +71,9 @@ def run_feedback():
     abstract_id = data["abstract_id"]
     batch_id = data['batch_id']
     full_type = data['full_type']
-    user = users_collection.find_one({"prolific_id": prolific_id})
     phase = "interactive"
-    abstract_info = user["phases"][phase]["batches"][batch_id]["abstracts"][abstract_id]
+    record = participants.get_abstract(prolific_id, phase, batch_id, abstract_id)
+    abstract_info = record.sata
     with st.sidebar:
         st.write(f"**Prolific ID:** `{prolific_id}`")
         if st.button("Logout"):
@@ -191,44 +185,14 @@ def run_feedback():
         if "feedback" not in st.session_state:
             st.session_state.feedback = {"main_idea": "", "method": "", "attention": "", "result": ""}
 
-        questions = [
-            {
-                "key": "q1",
-                "text": abstract_info["question_1"],
-                "choices": parse_choices(abstract_info["question_1_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_1_correct_answers"])
-            },
-            {
-                "key": "q2",
-                "text": abstract_info["question_2"],
-                "choices": parse_choices(abstract_info["question_2_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_2_correct_answers"])
-            },
-            {
-                "key": "q3",
-                "text": abstract_info["question_3"],
-                "choices": parse_choices(abstract_info["question_3_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_3_correct_answers"])
-            },
-            {
-                "key": "q4",
-                "text": abstract_info["question_4"],
-                "choices": parse_choices(abstract_info["question_4_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_4_correct_answers"])
-            },
-            {
-                "key": "q5",
-                "text": abstract_info["question_5"],
-                "choices": parse_choices(abstract_info["question_5_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_5_correct_answers"])
-            }
-        ]
+        # parsed once per abstract for the whole process (sata.py)
+        questions = get_sata_questions(abstract_id, abstract_info)
 
         if "sata_for_abstract" not in st.session_state:
             st.session_state.sata_for_abstract = None
 
         if st.session_state.sata_for_abstract != abstract_id:
-            st.session_state.sata_answers = {q["key"]: [] for q in questions}
+            st.session_state.sata_answers = {q.key: [] for q in questions}
             st.session_state.qa_index = 0
             st.session_state.question_start_time = datetime.utcnow()
 
@@ -238,22 +202,23 @@ def run_feedback():
             st.session_state.sata_for_abstract = abstract_id
 
         q = questions[st.session_state.qa_index]
-        st.subheader(q["text"])
+        st.subheader(q.text)
 
         selected = []
-        for choice in q["choices"]:
-            checkbox_key = f"{abstract_id}_{q['key']}_{hash(choice)}"
+        for choice_id, choice in enumerate(q.choices):
+            # the option position, the same in every server process
+            checkbox_key = f"{abstract_id}_{q.key}_{choice_id}"
             checked = st.checkbox(
                 choice,
                 key=checkbox_key,
-                value=choice in st.session_state.sata_answers[q["key"]]
+                value=choice in st.session_state.sata_answers[q.key]
             )
             if checked:
                 selected.append(choice)
 
-        st.session_state.sata_answers[q["key"]] = selected
+        st.session_state.sata_answers[q.key] = selected
         completed = sum(
-            len(st.session_state.sata_answers[q["key"]]) > 0
+            len(st.session_state.sata_answers[q.key]) > 0
             for q in questions
         )
 
@@ -280,6 +245,8 @@ def run_feedback():
 
                     feedback_data = {
                         "sata_answers": st.session_state.sata_answers,
+                        # scored against this version's answer key, even after a refresh
+                        "content_hash": record_content_hash(record),
                         "submitted_at": datetime.utcnow(),
                         "time_q1": st.session_state.get("q1_time", 0),
                         "time_q2": st.session_state.get("q2_time", 0),
@@ -287,8 +254,8 @@ def run_feedback():
                         "time_q4": st.session_state.get("q4_time", 0),
                         "time_q5": st.session_state.get("q5_time", 0),
                     }
-                    users_collection.update_one(
-                        {"prolific_id": data['prolific_id']},
+                    participants.update(
+                        data['prolific_id'],
                         {"$set": {
                             f"phases.interactive.batches.{data['batch_id']}.abstracts.{data['abstract_id']}.sata": feedback_data,
                             f"phases.interactive.batches.{data['batch_id']}.abstracts.{data['abstract_id']}.sata_submitted": True
@@ -310,8 +277,8 @@ def run_feedback():
                         "total": total
                     }
 
-                    users_collection.update_one(
-                        {"prolific_id": prolific_id},
+                    participants.update(
+                        prolific_id,
                         {"$set": {
                             "last_page": "short_answers",
                             "last_batch": batch_id,
@@ -1,5 +1,7 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import get_users_collection
+from repository import ParticipantRepository
+from corpus import get_abstract_content
 from datetime import datetime
 import sys
 from navigation import render_nav
@@ -18,15 +20,9 @@ st.markdown(
 )
 
 st.set_page_config(layout="wide")
-@st.cache_resource
-def get_mongo_client():
-    return MongoClient(st.secrets["MONGO_URI"])
-
-# connect to MongoDB
-MONGO_URI = st.secrets["MONGO_URI"]
-client = MongoClient(MONGO_URI)
-db = client["pls"]
-users_collection = db["users"]
+# connect to MongoDB through the shared pooled client
+users_collection = get_users_collection()
+participants = ParticipantRepository(users_collection, cache=st.session_state, content=get_abstract_content)
 
 @st.dialog("Are you sure you want to move on from this abstract?", dismissible=True)
 def confirm_next_abstract():
@@ -292,9 +288,6 @@ def run_likert():
         q8 = persistent_radio("How well did this SUMMARY focus on the aspects that mattered most to you?", "importance")
         q9 = persistent_radio("How well did this SUMMARY feel tailored to you?", "tailored")
 
-        client = MongoClient(st.secrets["MONGO_URI"])
-        db = client["pls"]
-        users_collection = db["users"]
         all_answered = all(
             st.session_state.get(k) is not None for k in
             ["simplicity", "coherence", "informativeness", "background", "faithfulness", "understanding", "explanation", "importance", "tailored"]
@@ -344,39 +337,29 @@ def run_likert():
                     "tailored": q9
                 }
             }
-            users_collection.update_one(
-                {"prolific_id": prolific_id},
-                {
-                    "$set": {
-                        f"phases.static.batches.{batch_id}.abstracts.{abstract_id}.likert": responses,
-                        f"phases.static.batches.{batch_id}.abstracts.{abstract_id}.likert_submitted": True,
-                        f"phases.static.batches.{batch_id}.abstracts.{abstract_id}.completed": True
-                    }
-                }
+            # likert answers, completion, batch flag and last_page in one write
+            next_id = participants.complete_abstract(
+                prolific_id, "static", batch_id, abstract_id,
+                {"likert": responses, "likert_submitted": True},
+                last={
+                    "last_page": "static_likert",
+                    "last_batch": batch_id,
+                    "last_abs_id": abstract_id,
+                    "last_full_type": full_type
+                },
             )
             st.session_state.pop("likert_start_time", None)
 
-            # Get user's abstracts for the *current batch*
-            user = users_collection.find_one(
-                {"prolific_id": prolific_id},
-                {f"phases.static.batches.{batch_id}.abstracts": 1, "_id": 0}
-            )
-            abstracts = user["phases"]["static"]["batches"][batch_id]["abstracts"]
             next_abstract = None
-            for aid in sorted(abstracts.keys(), key=lambda x: int(x)):
-                if not abstracts[aid].get("completed", False):
-                    next_abstract = {
-                        "abstract_id": aid,
-                        "abstract": abstracts[aid].get("abstract", ""),
-                        "abstract_title": abstracts[aid].get("abstract_title", "")
-                    }
-                    break
+            if next_id is not None:
+                record = participants.get_abstract(prolific_id, "static", batch_id, next_id)
+                next_abstract = {
+                    "abstract_id": record.abstract_id,
+                    "abstract": record.abstract,
+                    "abstract_title": record.abstract_title
+                }
 
             if next_abstract is None:
-                users_collection.update_one(
-                    {"prolific_id": prolific_id},
-                    {"$set": {f"phases.static.batches.{batch_id}.completed": True}}
-                )
                 st.session_state.last_batch = batch_id
                 st.session_state.prolific_id = prolific_id
 
@@ -404,15 +387,6 @@ def run_likert():
                 "show_summary",
             ]:
                 st.session_state.pop(k, None)
-            users_collection.update_one(
-                {"prolific_id": prolific_id},
-                {"$set": {
-                    "last_page": "static_likert",
-                    "last_batch": batch_id,
-                    "last_abs_id": abstract_id,
-                    "last_full_type": full_type
-                }}
-            )
             st.switch_page("pages/term_familarity_page.py")            
 
 run_likert()
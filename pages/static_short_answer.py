@@ -1,5 +1,8 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import get_users_collection
+from repository import ParticipantRepository
+from corpus import get_abstract_content, record_content_hash
+from sata import get_sata_questions
 from datetime import datetime
 import sys
 from navigation import render_nav
@@ -25,15 +28,9 @@ if "q1_time" not in st.session_state:
     st.session_state.q4_time = 0
     st.session_state.q5_time = 0
 
-@st.cache_resource
-def get_mongo_client():
-    return MongoClient(st.secrets["MONGO_URI"])
-
-# connect to MongoDB
-MONGO_URI = st.secrets["MONGO_URI"]
-client = MongoClient(MONGO_URI)
-db = client["pls"]
-users_collection = db["users"]
+# connect to MongoDB through the shared pooled client
+users_collection = get_users_collection()
+participants = ParticipantRepository(users_collection, cache=st.session_state, content=get_abstract_content)
 
 @st.fragment
 def summary_fragment(pls_text, font_size):
@@ -57,12 +54,14 @@ def summary_fragment(pls_text, font_size):
         unsafe_allow_html=True
     )
 
-@st.cache_data
+# no cache here: the document comes from the session cache and the shared text
+# from get_abstract_content, whose ttl bounds how stale a refreshed abstract can be
 def load_abstract_info(prolific_id, batch_id, abstract_id):
-    user = users_collection.find_one({"prolific_id": prolific_id})
-    if not user:
-        return None
-    return user["phases"]["static"]["batches"][batch_id]["abstracts"][abstract_id]
+    record = participants.get_abstract(prolific_id, "static", batch_id, abstract_id)
+    if record is None:
+        return None, None
+    # the version answered, so scoring.py uses the answer key the participant saw
+    return record.sata, record_content_hash(record)
 
 @st.dialog("Are you sure you want to log out?", dismissible=False)
 def logout_confirm_dialog(prolific_id):
@@ -106,9 +105,6 @@ def accumulate_question_time():
         st.session_state[q_key] = st.session_state.get(q_key, 0) + elapsed
     st.session_state.question_start_time = datetime.utcnow()
 
-def parse_choices(s):
-    return [x.strip() for x in s.split(";") if x.strip()]
-
 def show_progress():
     if "progress_info" in st.session_state:
         progress = st.session_state.progress_info
@@ -128,7 +124,7 @@ def run_feedback():
         "full_type": st.session_state.get("full_type", None)
     }
 
-    abstract_info = load_abstract_info(
+    abstract_info, content_hash = load_abstract_info(
         data["prolific_id"], 
         data["batch_id"], 
         data["abstract_id"]
@@ -217,59 +213,30 @@ def run_feedback():
                 accumulate_question_time()
                 st.session_state.last_qa_index = st.session_state.qa_index
 
-        questions = [
-            {
-                "key": "q1",
-                "text": abstract_info["question_1"],
-                "choices": parse_choices(abstract_info["question_1_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_1_correct_answers"])
-            },
-            {
-                "key": "q2",
-                "text": abstract_info["question_2"],
-                "choices": parse_choices(abstract_info["question_2_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_2_correct_answers"])
-            },
-            {
-                "key": "q3",
-                "text": abstract_info["question_3"],
-                "choices": parse_choices(abstract_info["question_3_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_3_correct_answers"])
-            },
-            {
-                "key": "q4",
-                "text": abstract_info["question_4"],
-                "choices": parse_choices(abstract_info["question_4_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_4_correct_answers"])
-            },
-            {
-                "key": "q5",
-                "text": abstract_info["question_5"],
-                "choices": parse_choices(abstract_info["question_5_answers_choices"]),
-                "correct": parse_choices(abstract_info["question_5_correct_answers"])
-            },
-        ]
+        # parsed once per abstract for the whole process (sata.py)
+        questions = get_sata_questions(data['abstract_id'], abstract_info)
 
         if "sata_answers" not in st.session_state:
-            st.session_state.sata_answers = {q["key"]: [] for q in questions}
+            st.session_state.sata_answers = {q.key: [] for q in questions}
 
         q = questions[st.session_state.qa_index]
-        st.subheader(q["text"])
+        st.subheader(q.text)
 
         selected = []
-        for choice in q["choices"]:
-            checkbox_key = f"{data['abstract_id']}_{q['key']}_{hash(choice)}"
+        for choice_id, choice in enumerate(q.choices):
+            # the option position, the same in every server process
+            checkbox_key = f"{data['abstract_id']}_{q.key}_{choice_id}"
             checked = st.checkbox(
                 choice,
                 key=checkbox_key,
-                value=choice in st.session_state.sata_answers[q["key"]]
+                value=choice in st.session_state.sata_answers[q.key]
             )
             if checked:
                 selected.append(choice)
 
-        st.session_state.sata_answers[q["key"]] = selected
+        st.session_state.sata_answers[q.key] = selected
         completed = sum(
-            len(st.session_state.sata_answers[q["key"]]) > 0
+            len(st.session_state.sata_answers[q.key]) > 0
             for q in questions
         )
 
@@ -297,6 +264,7 @@ def run_feedback():
                     # Save
                     feedback_data = {
                         "sata_answers": st.session_state.sata_answers,
+                        "content_hash": content_hash,
                         "submitted_at": datetime.utcnow(),
                         "time_q1": st.session_state.get("q1_time", 0),
                         "time_q2": st.session_state.get("q2_time", 0),
@@ -304,16 +272,16 @@ def run_feedback():
                         "time_q4": st.session_state.get("q4_time", 0),
                         "time_q5": st.session_state.get("q5_time", 0),
                     }
-                    users_collection.update_one(
-                        {"prolific_id": data['prolific_id']},
+                    participants.update(
+                        data['prolific_id'],
                         {"$set": {
                             f"phases.static.batches.{data['batch_id']}.abstracts.{data['abstract_id']}.sata": feedback_data,
                             f"phases.static.batches.{data['batch_id']}.abstracts.{data['abstract_id']}.sata_submitted": True
                         }}
                     )
 
-                    users_collection.update_one(
-                        {"prolific_id": data['prolific_id']},
+                    participants.update(
+                        data['prolific_id'],
                         {"$set": {
                             "last_page": "static_short_answer",
                             "last_batch": data["batch_id"],
@@ -1,5 +1,7 @@
 import streamlit as st
-from pymongo import MongoClient
+from database import get_users_collection
+from repository import ParticipantRepository
+from corpus import ABSTRACT_CACHE_TTL, get_abstract_content
 import re
 import sys
 import datetime
@@ -40,18 +42,11 @@ st.markdown(
 st.set_page_config(layout="wide")
 
 
-@st.cache_resource
-def get_mongo_client():
-    return MongoClient(st.secrets["MONGO_URI"])
+# connect to MongoDB through the shared pooled client
+users_collection = get_users_collection()
+participants = ParticipantRepository(users_collection, cache=st.session_state, content=get_abstract_content)
 
-# connect to MongoDB
-MONGO_URI = st.secrets["MONGO_URI"]
-client = MongoClient(MONGO_URI)
-db = client["pls"]
-users_collection = db["users"]
-
-@st.fragment
-def familiarity_fragment(abs_item, abstract_id):
+def familiarity_rows(abs_item, abstract_id):
     updated_terms = []
 
     for idx, term_item in enumerate(abs_item["terms"]):
@@ -132,7 +127,6 @@ def abstract_fragment(abs_item, font_size):
         """,
         unsafe_allow_html=True
     )
-@st.fragment
 def familiarity_page(abs_item, abstract_id):
     st.subheader("How familiar are you with each term?")
     st.markdown(":red[**All fields are required before continuing.**]")
@@ -145,35 +139,24 @@ def familiarity_page(abs_item, abstract_id):
     5 = Extremely familiar  
     """)
 
-    updated_terms = familiarity_fragment(abs_item, abstract_id)
-    st.markdown("---")
-
-    LIKERT_PLACEHOLDER = "— Select familiarity —"
-    total_terms = len(abs_item["terms"])
-    num_answered = 0
-
-    for idx in range(total_terms):
-        key = f"fam_{abstract_id}_{idx}"
-        val = st.session_state.get(key)
-        if val is not None and val != LIKERT_PLACEHOLDER:
-            num_answered += 1
+    # one form, so moving the sliders doesn't rerun the page; everything arrives on Next
+    with st.form(f"fam_form_{abstract_id}", border=False):
+        updated_terms = familiarity_rows(abs_item, abstract_id)
+        st.markdown("---")
+        col1, col2, col3, col4, col5, col6 = st.columns(6)
+        with col6:
+            next_clicked = st.form_submit_button("Next ➡️", key=f"next_btn_fam_{abstract_id}")
 
-    all_fam_filled = (num_answered == total_terms)
-    return updated_terms, all_fam_filled
+    all_fam_filled = all(t["familiarity_score"] is not None for t in updated_terms)
+    return updated_terms, all_fam_filled, next_clicked
 
-@st.cache_data
-def cached_highlight(abstract, terms):
+# keyed on the abstract, its term strings and its text (cache_data hashes the text), so
+# everyone who sees the same version of an abstract shares one entry; an embedded copy
+# kept back by a refresh and the corrected corpus text get separate entries
+@st.cache_data(ttl=ABSTRACT_CACHE_TTL, max_entries=500)
+def cached_highlight(abstract_id, terms, abstract):
     return highlight_terms_in_abstract(abstract, terms)
 
-def load_user(prolific_id, projection=None):
-    return users_collection.find_one(
-        {"prolific_id": prolific_id},
-        projection
-    )
-
-def load_user_info(prolific_id):
-    return users_collection.find_one({"prolific_id": prolific_id})
-
 @st.dialog("Are you sure you want to log out?", dismissible=False)
 def logout_confirm_dialog(prolific_id):
     st.markdown(
@@ -197,33 +180,29 @@ def logout_confirm_dialog(prolific_id):
             st.switch_page("app.py")
 
 def get_static_progress(prolific_id, batch_id):
-    user = load_user(
-        prolific_id,
-        {f"phases.static.batches.{batch_id}.abstracts": 1, "_id": 0}
+    progress = participants.get_batch_progress(prolific_id, "static", batch_id)
+    return progress.completed, progress.total
+
+# one pattern per term list, longest terms first so "face masks" wins over "face"
+@st.cache_resource(max_entries=256)
+def compile_terms(terms):
+    ordered = sorted(set(t.lower() for t in terms), key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(t) for t in ordered) + r")\b", re.IGNORECASE)
+
+def highlight_terms_in_abstract(abstract: str, terms: tuple):
+    names = [t for t in terms if t]
+    if not names:
+        return abstract
+    # first listed spelling of a term decides its color
+    colors = {}
+    for idx, term in enumerate(terms):
+        colors.setdefault(term.lower(), TERM_COLORS[idx % len(TERM_COLORS)])
+
+    # single pass over the original text, so inserted markup is never matched again
+    return compile_terms(tuple(names)).sub(
+        lambda m: f'<span style="background-color:{colors.get(m.group(1).lower(), TERM_COLORS[0])}; padding:2px 4px; border-radius:4px;">{m.group(1)}</span>',
+        abstract,
     )
-    if not user:
-        return 0, 0
-
-    abstracts = (
-        user["phases"]["static"]["batches"][batch_id]["abstracts"]
-    )
-    total = len(abstracts)
-    completed = sum(1 for a in abstracts.values() if a.get("completed", False))
-    return completed, total
-
-def highlight_terms_in_abstract(abstract: str, terms: list):
-    highlighted = abstract
-    for idx, term_item in enumerate(terms):
-        term = term_item["term"]
-        color = TERM_COLORS[idx % len(TERM_COLORS)]
-        pattern = re.escape(term)
-        highlighted = re.sub(
-            fr"\b({pattern})\b",
-            rf'<span style="background-color:{color}; padding:2px 4px; border-radius:4px;">\1</span>',
-            highlighted,
-            flags=re.IGNORECASE
-        )
-    return highlighted
 
 
 @st.dialog("📝 Instructions", width="medium", dismissible=False)
@@ -301,39 +280,24 @@ def static_instructions(prolific_id, batch_id):
 
     if st.button("Start"):
         st.session_state.seen_static_instructions = True
-        users_collection.update_one(
-            {"prolific_id": prolific_id},
+        participants.update(
+            prolific_id,
             {"$set": {f"phases.static.batches.{batch_id}.seen_instructions": True}},
             upsert=True
         )
         st.rerun()
 
-def get_user_static_abstracts(prolific_id, batch_id):
-    user = load_user(
-        prolific_id,
-        {f"phases.static.batches.{batch_id}.abstracts": 1, "_id": 0}
-    )
-    if not user:
-        return []
-
-    abstracts_dict = (
-        user["phases"]["static"]["batches"][batch_id]["abstracts"]
-    )
-
-    abstracts = []
-
-    for abstract_id in sorted(abstracts_dict.keys(), key=lambda x: int(x)):
-        data = abstracts_dict[abstract_id]
-        if not data.get("completed", False):
-            abstracts.append({
-                "abstract_id": abstract_id,
-                "abstract_title": data.get("abstract_title", ""),
-                "abstract": data.get("abstract", ""),
-                "human_written_pls": data.get("human_written_pls", ""),
-                "terms": data.get("term_familarity", [])
-            })
-
-    return abstracts
+def get_next_static_abstract(prolific_id, batch_id):
+    record = participants.get_next_incomplete_abstract(prolific_id, "static", batch_id)
+    if record is None:
+        return None
+    return {
+        "abstract_id": record.abstract_id,
+        "abstract_title": record.abstract_title,
+        "abstract": record.abstract,
+        "human_written_pls": record.human_written_pls,
+        "terms": record.terms
+    }
 
 def extra_info_term_block(
     idx, term, color, abstract_id, current_state
@@ -358,30 +322,24 @@ def extra_info_term_block(
     with col_opts:
         base_key = f"extra_{abstract_id}_{idx}"
 
-        none_selected = ("None" in current_state)
-        disabled_others = none_selected
-
         # Render checkboxes in 4 columns
         c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
         with c1:
             def_val = st.checkbox(
                 "Definition", 
                 key=f"{base_key}_def",
-                disabled=none_selected,
                 value=("Definition" in current_state)
             )
         with c2:
             ex_val = st.checkbox(
                 "Example",
                 key=f"{base_key}_ex",
-                disabled=none_selected,
                 value=("Example" in current_state)
             )
         with c3:
             bg_val = st.checkbox(
                 "Background",
                 key=f"{base_key}_bg",
-                disabled=none_selected,
                 value=("Background" in current_state)
             )
         with c4:
@@ -391,17 +349,16 @@ def extra_info_term_block(
                 value=("None" in current_state)
             )
 
-        # Rebuild new state list
+        # Rebuild new state list (None together with other options is rejected on submit)
+        new_list = []
+        if def_val:
+            new_list.append("Definition")
+        if ex_val:
+            new_list.append("Example")
+        if bg_val:
+            new_list.append("Background")
         if none_val:
-            new_list = ["None"]
-        else:
-            new_list = []
-            if def_val:
-                new_list.append("Definition")
-            if ex_val:
-                new_list.append("Example")
-            if bg_val:
-                new_list.append("Background")
+            new_list.append("None")
         return new_list
 
 
@@ -428,14 +385,7 @@ def run_terms(prolific_id, batch_id, full_type):
         st.session_state.time_extra_info = 0
 
     # Instruction check
-    user = load_user_info(prolific_id)
-    db_seen = (
-        user.get("phases", {})
-            .get("static", {})
-            .get("batches", {})
-            .get(batch_id, {})
-            .get("seen_instructions", False)
-    )
+    db_seen = participants.get_seen_instructions(prolific_id, "static", batch_id)
 
     if "seen_static_instructions" not in st.session_state:
         st.session_state.seen_static_instructions = db_seen
@@ -452,7 +402,6 @@ def run_terms(prolific_id, batch_id, full_type):
 
     st.title("Term Familiarity")
     abs_item = None    
-    abstracts = None     
 
     if "next_static_abstract" in st.session_state:
         n = st.session_state.next_static_abstract
@@ -463,21 +412,15 @@ def run_terms(prolific_id, batch_id, full_type):
             "human_written_pls": n.get("human_written_pls", ""),
             "terms": []
         }
-        user = load_user(
-            prolific_id,
-            {f"phases.static.batches.{batch_id}.abstracts.{n['abstract_id']}": 1}
-        )
-        db_abs = user["phases"]["static"]["batches"][batch_id]["abstracts"][n["abstract_id"]]
-        abs_item["terms"] = db_abs.get("term_familarity", [])
-        abs_item["human_written_pls"] = db_abs.get("human_written_pls", "")
+        db_abs = participants.get_abstract(prolific_id, "static", batch_id, n["abstract_id"])
+        abs_item["terms"] = db_abs.terms
+        abs_item["human_written_pls"] = db_abs.human_written_pls
     else:
-        abstracts = get_user_static_abstracts(prolific_id, batch_id)
-        if not abstracts:
+        abs_item = get_next_static_abstract(prolific_id, batch_id)
+        if not abs_item:
             st.success("🎉 All abstracts completed for both phases!")
             st.stop()
 
-        abs_item = abstracts[0]
-
     abstract_id = abs_item["abstract_id"]
     current_abs_id = abs_item["abstract_id"]
     if st.session_state.get("current_term_abs_id") != current_abs_id:
@@ -528,21 +471,16 @@ def run_terms(prolific_id, batch_id, full_type):
             st.session_state.abstract_font_size = min(30, st.session_state.abstract_font_size + 2)
             st.rerun()
 
-    abs_item["highlighted_html"] = cached_highlight(abs_item["abstract"], abs_item["terms"])
+    abs_item["highlighted_html"] = cached_highlight(
+        str(abstract_id), tuple(t["term"] for t in abs_item["terms"]), abs_item["abstract"]
+    )
     abstract_fragment(abs_item, st.session_state.abstract_font_size)
 
     if st.session_state.stage_static == "familiarity":
         if st.session_state.get("fam_start_time") is None:
             st.session_state.fam_start_time = datetime.datetime.utcnow()
 
-        updated_terms, all_fam_filled = familiarity_page(abs_item, abstract_id)
-        col1, col2, col3, col4, col5, col6 = st.columns(6)
-        with col6:
-            next_clicked = st.button(
-                "Next ➡️",
-                key=f"next_btn_fam_{abstract_id}",
-                disabled=False  # Always enabled
-            )
+        updated_terms, all_fam_filled, next_clicked = familiarity_page(abs_item, abstract_id)
 
         if next_clicked:
             if all_fam_filled:
@@ -571,55 +509,52 @@ def run_terms(prolific_id, batch_id, full_type):
         if "extra_info_state" not in st.session_state:
             st.session_state.extra_info_state = {term: [] for term in terms}
 
-        cleaned_extra = []
-        for idx, term in enumerate(terms):
-            color = TERM_COLORS[idx % len(TERM_COLORS)]
-            current_state = st.session_state.extra_info_state.get(term, [])
-
-            new_state = extra_info_term_block(
-                idx=idx,
-                term=term,
-                color=color,
-                abstract_id=abstract_id,
-                current_state=current_state
-            )
-            if new_state != current_state:
-                st.session_state.extra_info_state[term] = new_state
-            final_state = new_state if new_state is not None else current_state
-
-            cleaned_extra.append({
-                "term": term,
-                "extra_information": final_state
-            })
-        st.markdown("---")
-        all_filled = all(
-            len(st.session_state.extra_info_state.get(term, [])) > 0
-            for term in terms
-        )
-        col_back, col_pass1, col_pass2, col_pass3, col_pass4, col_next = st.columns([1, 1, 1, 1, 1, 1])
-        with col_back:
-            if st.button("⬅️ Back", key=f"back_extra_{abstract_id}"):
-                st.session_state.stage_static = "familiarity"
-                st.rerun()
-        with col_pass1: 
-            pass
-        with col_pass2: 
-            pass
-        with col_pass3: 
-            pass
-        with col_pass4: 
-            pass
-        with col_next:
-            next_clicked = st.button("Next ➡️", key=f"next_extra_{abstract_id}")
+        # one form for all terms, the checkboxes only reach the server on Back / Next
+        with st.form(f"extra_form_{abstract_id}", border=False):
+            cleaned_extra = []
+            for idx, term in enumerate(terms):
+                color = TERM_COLORS[idx % len(TERM_COLORS)]
+                current_state = st.session_state.extra_info_state.get(term, [])
+
+                new_state = extra_info_term_block(
+                    idx=idx,
+                    term=term,
+                    color=color,
+                    abstract_id=abstract_id,
+                    current_state=current_state
+                )
+
+                cleaned_extra.append({
+                    "term": term,
+                    "extra_information": new_state
+                })
+            st.markdown("---")
+            col_back, col_pass1, col_pass2, col_pass3, col_pass4, col_next = st.columns([1, 1, 1, 1, 1, 1])
+            with col_back:
+                back_clicked = st.form_submit_button("⬅️ Back", key=f"back_extra_{abstract_id}")
+            with col_next:
+                next_clicked = st.form_submit_button("Next ➡️", key=f"next_extra_{abstract_id}")
+
+        if back_clicked or next_clicked:
+            st.session_state.extra_info_state = {
+                row["term"]: row["extra_information"] for row in cleaned_extra
+            }
+
+        if back_clicked:
+            st.session_state.stage_static = "familiarity"
+            st.rerun()
 
         if next_clicked:
-            all_filled = all(
-                len(st.session_state.extra_info_state.get(term, [])) > 0
-                for term in terms
+            all_filled = all(len(row["extra_information"]) > 0 for row in cleaned_extra)
+            none_mixed = any(
+                "None" in row["extra_information"] and len(row["extra_information"]) > 1
+                for row in cleaned_extra
             )
 
             if not all_filled:
                 st.warning("⚠️ Please complete all fields to continue.")
+            elif none_mixed:
+                st.warning("⚠️ Please select either None or other options for a term, not both.")
             else:
                 if st.session_state.extra_start_time:
                     elapsed = (datetime.datetime.utcnow() - st.session_state.extra_start_time).total_seconds()
@@ -630,8 +565,8 @@ def run_terms(prolific_id, batch_id, full_type):
                 for i, row in enumerate(cleaned_extra):
                     final_terms[i]["extra_information"] = row["extra_information"]
 
-                users_collection.update_one(
-                    {"prolific_id": prolific_id},
+                participants.update(
+                    prolific_id,
                     {"$set": {
                         f"phases.static.batches.{batch_id}.abstracts.{abstract_id}.term_familarity": final_terms,
                         f"phases.static.batches.{batch_id}.abstracts.{abstract_id}.time_familiarity": st.session_state.time_familiarity,
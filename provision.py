@@ -0,0 +1,64 @@
+import argparse
+import datetime
+import os
+import time
+
+from pymongo import UpdateOne
+
+from assignments import ASSIGNMENTS_CSV, build_all_phases, prepare_assignments, read_assignments
+from corpus import upsert_corpus
+from database import DB_NAME, create_mongo_client, ensure_indexes
+
+
+def provision_ops(all_phases, now):
+    # $setOnInsert never touches participants who already exist (and their progress)
+    return [
+        UpdateOne(
+            {"prolific_id": prolific_id},
+            {"$setOnInsert": {
+                "prolific_id": prolific_id,
+                "created_at": now,
+                "accepted_terms": False,
+                "phases": phases,
+            }},
+            upsert=True,
+        )
+        for prolific_id, phases in all_phases.items()
+    ]
+
+
+def provision(collection, abstracts_collection, df, batch_size=500, dry_run=False):
+    start = time.time()
+    prepared = prepare_assignments(df)
+    all_phases = build_all_phases(prepared)
+    ops = provision_ops(all_phases, datetime.datetime.utcnow())
+    print(f"Built {len(ops)} participant documents in {time.time() - start:.2f}s")
+
+    if dry_run:
+        return 0
+
+    # shared abstract text first, so new participants never reference a missing abstract
+    print("New abstracts:", upsert_corpus(abstracts_collection, prepared))
+
+    created = 0
+    for i in range(0, len(ops), batch_size):
+        result = collection.bulk_write(ops[i:i + batch_size], ordered=False)
+        created += result.upserted_count
+    return created
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create participant documents from the assignment sheet.")
+    parser.add_argument("--csv", default=ASSIGNMENTS_CSV)
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI"))
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    db = create_mongo_client(args.mongo_uri)[DB_NAME]
+    if not args.dry_run:
+        ensure_indexes(db)
+    created = provision(db["users"], db["abstracts"], read_assignments(args.csv), args.batch_size, args.dry_run)
+
+    print("New participants:", created)
+    print("DRY_RUN:", args.dry_run)
@@ -0,0 +1,338 @@
+import copy
+from dataclasses import dataclass, field
+
+from pymongo import ReturnDocument
+
+# raw SATA fields stored on every embedded abstract
+SATA_FIELDS = [
+    f"question_{i}{suffix}"
+    for i in range(1, 6)
+    for suffix in ("", "_answers_choices", "_correct_answers")
+]
+
+# fields needed to render an abstract (never the chat logs / answers)
+ABSTRACT_FIELDS = [
+    "abstract_title",
+    "abstract",
+    "human_written_pls",
+    "term_familarity",
+    "completed",
+    "content_hash",
+] + SATA_FIELDS
+
+
+@dataclass
+class AbstractProgress:
+    abstract_id: str
+    completed: bool
+
+
+@dataclass
+class BatchProgress:
+    abstracts: list = field(default_factory=list)
+
+    @property
+    def total(self):
+        return len(self.abstracts)
+
+    @property
+    def completed(self):
+        return sum(1 for a in self.abstracts if a.completed)
+
+    @property
+    def next_incomplete_id(self):
+        for a in self.abstracts:
+            if not a.completed:
+                return a.abstract_id
+        return None
+
+
+@dataclass
+class BatchState:
+    full_type: str
+    phase_type: str
+    batch_id: str
+    completed: bool
+    unlocked: bool
+
+
+@dataclass
+class AbstractRecord:
+    abstract_id: str
+    abstract_title: str = ""
+    abstract: str = ""
+    human_written_pls: str = ""
+    terms: list = field(default_factory=list)
+    completed: bool = False
+    sata: dict = field(default_factory=dict)
+    # "" for copies embedded before hashes were stored (see corpus.record_content_hash)
+    content_hash: str = ""
+
+
+def batch_path(phase, batch_id):
+    return f"phases.{phase}.batches.{batch_id}"
+
+
+def abstract_path(phase, batch_id, abstract_id):
+    return f"{batch_path(phase, batch_id)}.abstracts.{abstract_id}"
+
+
+def get_path(doc, path, default=None):
+    """Walk a dotted path through nested dicts."""
+    cur = doc
+    for part in path.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return default
+        cur = cur[part]
+    return cur
+
+
+def set_path(doc, path, value):
+    parts = path.split(".")
+    cur = doc
+    for part in parts[:-1]:
+        if not isinstance(cur.get(part), dict):
+            cur[part] = {}
+        cur = cur[part]
+    cur[parts[-1]] = value
+
+
+def unset_path(doc, path):
+    parts = path.split(".")
+    parent = get_path(doc, ".".join(parts[:-1])) if len(parts) > 1 else doc
+    if isinstance(parent, dict):
+        parent.pop(parts[-1], None)
+
+
+def apply_update(doc, update):
+    """Mirror a $set/$unset update onto an in-memory copy of the document."""
+    for path, value in update.get("$set", {}).items():
+        set_path(doc, path, copy.deepcopy(value))
+    for path in update.get("$unset", {}):
+        unset_path(doc, path)
+    return doc
+
+
+def abstract_record(abstract_id, data):
+    data = data or {}
+    return AbstractRecord(
+        abstract_id=str(abstract_id),
+        abstract_title=data.get("abstract_title") or "",
+        abstract=data.get("abstract") or "",
+        human_written_pls=data.get("human_written_pls") or "",
+        terms=data.get("term_familarity", []),
+        completed=data.get("completed", False),
+        sata={k: data[k] for k in SATA_FIELDS if k in data},
+        content_hash=data.get("content_hash") or "",
+    )
+
+
+def batch_progress(abstracts):
+    """abstracts: iterable of (abstract_id, completed) pairs."""
+    items = [AbstractProgress(str(aid), bool(done)) for aid, done in abstracts]
+    items.sort(key=lambda a: int(a.abstract_id))
+    return BatchProgress(items)
+
+
+class ParticipantRepository:
+    """Typed reads of the `users` document, each with a tight projection.
+
+    When a session cache (st.session_state) is given, the participant document
+    is fetched once per session and every read is served from it; writes made
+    through `update` are applied to the cached copy so it never goes stale.
+
+    Abstract text is read from the shared `abstracts` collection through
+    `content`; copies embedded by older provisioning still take precedence.
+    """
+
+    CACHE_KEY = "participant_doc_cache"
+
+    def __init__(self, collection, cache=None, content=None):
+        self.collection = collection
+        self.cache = cache
+        # abstract_id -> shared abstract text/SATA items (corpus.get_abstract_content)
+        self.content = content
+
+    def load(self, prolific_id):
+        entry = self.cache.get(self.CACHE_KEY)
+        if entry is not None and entry["prolific_id"] == prolific_id:
+            return entry["doc"]
+        doc = self.collection.find_one({"prolific_id": prolific_id}, {"_id": 0})
+        if doc is not None:
+            self.cache[self.CACHE_KEY] = {"prolific_id": prolific_id, "doc": doc}
+        return doc
+
+    def invalidate(self):
+        if self.cache is not None:
+            self.cache.pop(self.CACHE_KEY, None)
+
+    def _cached_doc(self, prolific_id):
+        """The session's copy of the document, without fetching it."""
+        if self.cache is None:
+            return None
+        entry = self.cache.get(self.CACHE_KEY)
+        if entry is not None and entry["prolific_id"] == prolific_id:
+            return entry["doc"]
+        return None
+
+    def update(self, prolific_id, update, upsert=False):
+        result = self.collection.update_one({"prolific_id": prolific_id}, update, upsert=upsert)
+        doc = self._cached_doc(prolific_id)
+        if doc is not None:
+            apply_update(doc, update)
+        return result
+
+    def complete_abstract(self, prolific_id, phase, batch_id, abstract_id, fields, last=None):
+        """Finish an abstract in one round trip and return the next incomplete abstract_id.
+
+        A single pipeline update writes `fields` on the abstract, marks it
+        completed, records `last` (last_page etc.) and sets the batch's
+        completed flag from its abstracts, so a crash can never leave a
+        finished abstract in a batch that is not marked complete. The
+        completed flags of the batch come back in the same response.
+        Returns None when the batch is done.
+        """
+        apath = abstract_path(phase, batch_id, abstract_id)
+        bpath = batch_path(phase, batch_id)
+        values = {f"{apath}.{name}": value for name, value in fields.items()}
+        values[f"{apath}.completed"] = True
+        values.update(last or {})
+
+        pipeline = [
+            # $literal so answers starting with "$" are never read as field paths
+            {"$set": {path: {"$literal": value} for path, value in values.items()}},
+            {"$set": {f"{bpath}.completed": {"$eq": [
+                {"$size": {"$filter": {
+                    "input": {"$objectToArray": f"${bpath}.abstracts"},
+                    "cond": {"$ne": ["$$this.v.completed", True]},
+                }}},
+                0,
+            ]}}},
+        ]
+
+        # only the completed flags are needed back; list them when the ids are known
+        cached = self._cached_doc(prolific_id)
+        abstract_ids = list(get_path(cached or {}, f"{bpath}.abstracts", {}))
+        projection = {"_id": 0, f"{bpath}.completed": 1}
+        if abstract_ids:
+            projection.update({f"{bpath}.abstracts.{aid}.completed": 1 for aid in abstract_ids})
+        else:
+            projection[f"{bpath}.abstracts"] = 1
+
+        doc = self.collection.find_one_and_update(
+            {"prolific_id": prolific_id},
+            pipeline,
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return None
+
+        abstracts = get_path(doc, f"{bpath}.abstracts", {})
+        next_id = batch_progress((aid, a.get("completed", False)) for aid, a in abstracts.items()).next_incomplete_id
+        if cached is not None:
+            values[f"{bpath}.completed"] = get_path(doc, f"{bpath}.completed", False)
+            apply_update(cached, {"$set": values})
+        return next_id
+
+    def _find(self, prolific_id, projection):
+        if self.cache is not None:
+            return self.load(prolific_id)
+        return self.collection.find_one({"prolific_id": prolific_id}, projection)
+
+    def exists(self, prolific_id):
+        return self._find(prolific_id, {"_id": 1}) is not None
+
+    def get_batch_states(self, prolific_id, batch_order):
+        projection = {"_id": 0}
+        for full_type in batch_order:
+            phase_type, batch_id = full_type.split("_")
+            projection[f"{batch_path(phase_type, batch_id)}.completed"] = 1
+            projection[f"{batch_path(phase_type, batch_id)}.unlocked"] = 1
+        doc = self._find(prolific_id, projection)
+        if doc is None:
+            return None
+
+        states = []
+        for full_type in batch_order:
+            phase_type, batch_id = full_type.split("_")
+            batch = get_path(doc, batch_path(phase_type, batch_id))
+            # skip if this batch doesn't exist for this user
+            if batch is None:
+                continue
+            states.append(BatchState(
+                full_type=full_type,
+                phase_type=phase_type,
+                batch_id=batch_id,
+                completed=batch.get("completed", False),
+                unlocked=batch.get("unlocked", False),
+            ))
+        return states
+
+    def get_batch_progress(self, prolific_id, phase, batch_id):
+        if self.cache is not None:
+            abstracts = get_path(self.load(prolific_id) or {}, f"{batch_path(phase, batch_id)}.abstracts", {})
+            return batch_progress(
+                (aid, a.get("completed", False)) for aid, a in abstracts.items()
+            )
+
+        # project only (abstract_id, completed) pairs instead of whole abstracts
+        docs = list(self.collection.aggregate([
+            {"$match": {"prolific_id": prolific_id}},
+            {"$limit": 1},
+            {"$project": {
+                "_id": 0,
+                "progress": {
+                    "$map": {
+                        "input": {"$objectToArray": {
+                            "$ifNull": [f"${batch_path(phase, batch_id)}.abstracts", {}]
+                        }},
+                        "in": {"id": "$$this.k", "completed": "$$this.v.completed"},
+                    }
+                },
+            }},
+        ]))
+        doc = docs[0] if docs else None
+        if not doc:
+            return BatchProgress()
+        return batch_progress(
+            (item["id"], item.get("completed", False)) for item in doc.get("progress") or []
+        )
+
+    def get_abstract(self, prolific_id, phase, batch_id, abstract_id):
+        base = abstract_path(phase, batch_id, abstract_id)
+        projection = {"_id": 0}
+        for f in ABSTRACT_FIELDS:
+            projection[f"{base}.{f}"] = 1
+        doc = self._find(prolific_id, projection)
+        data = get_path(doc or {}, base)
+        if data is None:
+            return None
+        if self.content is not None and "abstract" not in data:
+            data = {**self.content(abstract_id), **data}
+        return abstract_record(abstract_id, data)
+
+    def get_next_incomplete_abstract(self, prolific_id, phase, batch_id):
+        next_id = self.get_batch_progress(prolific_id, phase, batch_id).next_incomplete_id
+        if next_id is None:
+            return None
+        return self.get_abstract(prolific_id, phase, batch_id, next_id)
+
+    def get_seen_instructions(self, prolific_id, phase, batch_id):
+        path = f"{batch_path(phase, batch_id)}.seen_instructions"
+        doc = self._find(prolific_id, {"_id": 0, path: 1})
+        return bool(get_path(doc or {}, path, False))
+
+    def get_conversation_log(self, prolific_id, phase, batch_id, abstract_id):
+        path = f"{abstract_path(phase, batch_id, abstract_id)}.conversation_log"
+        doc = self._find(prolific_id, {"_id": 0, path: 1})
+        return get_path(doc or {}, path, []) or []
+
+    def has_accepted_terms(self, prolific_id):
+        doc = self._find(prolific_id, {"_id": 0, "accepted_terms": 1})
+        return bool((doc or {}).get("accepted_terms", False))
+
+    def get_last_completed_index(self, prolific_id):
+        path = "phases.interactive.last_completed_index"
+        doc = self._find(prolific_id, {"_id": 0, path: 1})
+        return get_path(doc or {}, path, 0)
@@ -0,0 +1,82 @@
+import sys
+
+import streamlit as st
+
+from repository import SATA_FIELDS
+
+QUESTION_NUMBERS = range(1, 6)
+
+
+def parse_choices(s):
+    if not isinstance(s, str):
+        return []
+    return [x.strip() for x in s.split(";") if x.strip()]
+
+
+class SataQuestion:
+    """One parsed select-all-that-apply item.
+
+    A choice id is the option's position in `choices`, so it is the same in
+    every process for the same question text (unlike hash(choice)).
+    `correct_answers` keeps the correct answers as written in the sheet,
+    including any that match no choice exactly.
+    """
+
+    __slots__ = ("number", "text", "choices", "correct_ids", "correct_answers")
+
+    def __init__(self, number, text, choices, correct_ids, correct_answers=()):
+        self.number = number
+        self.text = text
+        self.choices = choices
+        self.correct_ids = correct_ids
+        self.correct_answers = correct_answers
+
+    @classmethod
+    def parse(cls, number, sata):
+        # duplicated options collapse onto their first id
+        choices = tuple(dict.fromkeys(parse_choices(sata.get(f"question_{number}_answers_choices"))))
+        ids = {choice: i for i, choice in enumerate(choices)}
+        correct = tuple(parse_choices(sata.get(f"question_{number}_correct_answers")))
+        return cls(number, sata.get(f"question_{number}"), choices, frozenset(ids[c] for c in correct if c in ids), correct)
+
+    @property
+    def key(self):
+        return f"q{self.number}"
+
+    @property
+    def correct(self):
+        return [self.choices[i] for i in sorted(self.correct_ids)]
+
+    @property
+    def unmatched(self):
+        """Correct answers whose text matches no choice (they are not in correct_ids)."""
+        return [c for c in self.correct_answers if c not in self.choices]
+
+    @property
+    def correct_mask(self):
+        return sum(1 << i for i in self.correct_ids)
+
+
+def parse_sata(sata):
+    """SataQuestion for every question present in the raw question_N* fields."""
+    return tuple(SataQuestion.parse(n, sata) for n in QUESTION_NUMBERS if f"question_{n}" in sata)
+
+
+# abstract_id -> (raw fields, questions), shared by every session on this server process
+@st.cache_resource
+def _sata_cache():
+    return {}
+
+
+def get_sata_questions(abstract_id, sata):
+    """Parsed questions for an abstract; parsed again only if its text was corrected since."""
+    raw = tuple(sata.get(f) for f in SATA_FIELDS)
+    cache = _sata_cache()
+    entry = cache.get(str(abstract_id))
+    if entry is None or entry[0] != raw:
+        entry = (raw, parse_sata(sata))
+        cache[str(abstract_id)] = entry
+        for q in entry[1]:
+            if q.unmatched:
+                print(f">>>> abstract {abstract_id} {q.key}: correct answers match no choice: {q.unmatched}", file=sys.stderr)
+    return entry[1]
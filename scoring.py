@@ -0,0 +1,219 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from analytics import QUESTION_KEYS, iter_abstract_rows
+from corpus import content_hash, record_content_hash
+from database import DB_NAME, create_mongo_client
+from export import abstract_pipeline, abstract_rows
+from repository import SATA_FIELDS, abstract_record
+from sata import parse_sata
+
+# choices a participant picked that are not (or no longer) among the options;
+# never part of a correct mask, so they always count as wrong
+# (62 keeps every mask a non-negative int64 while it is summed)
+UNKNOWN_BIT = 62
+SCORE_COLUMNS = ["exact", "precision", "recall", "partial_credit"]
+# what the CLI reports on; "phase" is the condition (static / interactive / finetuned)
+SUMMARY_LEVELS = [["question"], ["abstract_id"], ["phase"], ["phase", "question"]]
+ANSWER_IDS = ["prolific_id", "full_type", "abstract_id"]
+# what an embedded copy needs to be hashed the way the page that showed it did
+EMBEDDED_FIELDS = ["abstract_title", "abstract", "human_written_pls", "content_hash"] + SATA_FIELDS
+
+
+def build_answer_key(docs):
+    """Parse every `;`-delimited choice string once (sata.SataQuestion).
+
+    `docs` maps a version (content_hash) to its raw SATA fields. Returns
+    (key, choices): key has one row per (version, question) with the correct
+    answers as a bitmask, choices maps each option text to its bit, which is
+    its choice id.
+    """
+    key_rows, choice_rows = [], []
+    for version, doc in docs.items():
+        for q in parse_sata(doc):
+            if not q.choices:
+                continue
+            key_rows.append((version, q.key, q.correct_mask, len(q.choices)))
+            choice_rows += [(version, q.key, choice, bit) for bit, choice in enumerate(q.choices)]
+
+    key = pd.DataFrame(key_rows, columns=["version", "question", "correct", "n_choices"])
+    key["correct"] = key["correct"].astype(np.uint64)
+    choices = pd.DataFrame(choice_rows, columns=["version", "question", "choice", "bit"])
+    return key, choices
+
+
+def load_versions(db):
+    """Every version of an abstract a participant can have answered.
+
+    Versions come from db["abstracts"] (current), db["abstract_versions"]
+    (replaced by `update_mongodb.py refresh`) and the copies embedded in
+    participant documents, which a refresh may have deliberately left alone.
+    Returns (docs, embedded, current): docs maps version -> raw SATA fields,
+    embedded has the version of each embedded copy by ANSWER_IDS, current
+    maps abstract_id -> the version db["abstracts"] holds now.
+    """
+    docs, current = {}, {}
+    for doc in db["abstracts"].find({}, {"_id": 0}):
+        version = doc.get("content_hash") or content_hash(doc)
+        docs[version] = doc
+        current[str(doc["abstract_id"])] = version
+    for doc in db["abstract_versions"].find({}, {"_id": 0}):
+        docs.setdefault(doc["content_hash"], doc)
+
+    embedded = []
+    for user in db["users"].aggregate(abstract_pipeline(EMBEDDED_FIELDS)):
+        for row in abstract_rows(user, EMBEDDED_FIELDS):
+            # copies provisioned without text read db["abstracts"] (ParticipantRepository.get_abstract)
+            if not row.get("abstract"):
+                continue
+            version = record_content_hash(abstract_record(row["abstract_id"], row))
+            docs.setdefault(version, row)
+            embedded.append((str(row["prolific_id"]), row["full_type"], str(row["abstract_id"]), version))
+    return docs, pd.DataFrame(embedded, columns=ANSWER_IDS + ["version"]), current
+
+
+def load_answer_key(db):
+    docs, embedded, current = load_versions(db)
+    key, choices = build_answer_key(docs)
+    return key, choices, embedded, current
+
+
+def answer_versions(table, embedded, current):
+    """(version, source) of the abstract each row of `table` was answered against.
+
+    The version recorded with the submission comes first, then the
+    participant's embedded copy. Older answers from participants who read
+    db["abstracts"] have neither and fall back to its current version.
+    """
+    ids = table[ANSWER_IDS].astype(str).reset_index(drop=True)
+    sources = pd.DataFrame({
+        "recorded": table["content_hash"].astype(object).to_numpy() if "content_hash" in table else None,
+        "embedded": ids.merge(embedded, on=ANSWER_IDS, how="left")["version"].to_numpy(),
+        "current": ids["abstract_id"].map(current).to_numpy(),
+    })
+    version = sources.bfill(axis=1).iloc[:, 0]
+    source = sources.notna().idxmax(axis=1).where(version.notna())
+    return pd.DataFrame({"version": version.to_numpy(), "version_source": source.to_numpy()}, index=table.index)
+
+
+def popcount(masks):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(masks).astype(np.int64)
+    # numpy < 2
+    as_bytes = masks.astype(">u8").view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1).astype(np.int64)
+
+
+def selection_masks(answers, choices):
+    """(row, question) -> bitmask of the selected choices; one row per answered question."""
+    long = answers.melt(
+        id_vars=["row", "version"],
+        value_vars=[f"{q}_answers" for q in QUESTION_KEYS],
+        var_name="question",
+        value_name="choice",
+    ).dropna(subset=["choice"])
+    long["question"] = long["question"].str.removesuffix("_answers")
+
+    # an empty selection still scores (as nothing picked)
+    answered = long[["row", "version", "question"]].drop_duplicates()
+    picked = long.explode("choice").dropna(subset=["choice"])
+    picked["choice"] = picked["choice"].astype(str).str.strip()
+    picked = picked.merge(choices, on=["version", "question", "choice"], how="left")
+    picked["bit"] = picked["bit"].fillna(UNKNOWN_BIT).astype(np.int64)
+    picked = picked.drop_duplicates(["row", "question", "bit"])
+    # bits are distinct within a group, so their sum is their OR
+    picked["mask"] = np.left_shift(np.int64(1), picked["bit"].to_numpy())
+    masks = picked.groupby(["row", "question"], sort=False)["mask"].sum().rename("selected")
+
+    # reindex rather than a left merge: NaN would turn the masks into floats
+    index = pd.MultiIndex.from_frame(answered[["row", "question"]])
+    answered["selected"] = masks.reindex(index, fill_value=0).to_numpy().astype(np.uint64)
+    return answered
+
+
+def score(table, key, choices):
+    """Score every (participant, abstract, question) with SATA answers.
+
+    `table` is the analytics table (analytics.py) or any frame with
+    prolific_id, phase, full_type, abstract_id and q1_answers..q5_answers
+    columns, plus the version each row was answered against
+    (answer_versions). Rows whose version has no answer key are left out,
+    see unscored. partial_credit is right-minus-wrong: (hits - wrong picks) /
+    correct answers, floored at 0.
+    """
+    answers = table.reset_index(drop=True).rename_axis("row").reset_index()
+    answers["abstract_id"] = answers["abstract_id"].astype(str)
+    answers["version"] = answers["version"].astype(object)
+    selected = selection_masks(answers, choices).merge(key, on=["version", "question"])
+
+    sel = selected["selected"].to_numpy(np.uint64)
+    correct = selected["correct"].to_numpy(np.uint64)
+    hits = popcount(sel & correct)
+    wrong = popcount(sel & ~correct)
+    n_correct = popcount(correct)
+    n_selected = popcount(sel)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        selected["exact"] = (sel == correct).astype(np.float64)
+        selected["precision"] = np.where(n_selected > 0, hits / n_selected, np.nan)
+        selected["recall"] = np.where(n_correct > 0, hits / n_correct, np.nan)
+        selected["partial_credit"] = np.where(
+            n_correct > 0, np.clip((hits - wrong) / n_correct, 0, None), np.nan
+        )
+
+    meta = answers[["row", "prolific_id", "phase", "full_type", "abstract_id"]]
+    scores = selected.merge(meta, on="row")
+    return scores[["prolific_id", "phase", "full_type", "abstract_id", "question"] + SCORE_COLUMNS]
+
+
+def unscored(table, key):
+    """Rows with SATA answers that no answer key matches."""
+    answered = table[[f"{q}_answers" for q in QUESTION_KEYS]].notna().any(axis=1)
+    return table[answered & ~table["version"].isin(key["version"])]
+
+
+def summarize(scores, by):
+    grouped = scores.groupby(by, observed=True)[SCORE_COLUMNS]
+    return grouped.mean().join(grouped.size().rename("n"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score SATA answers for the whole study.")
+    parser.add_argument("--table", help="analytics Parquet (analytics.py); read from Mongo when omitted")
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI"))
+    parser.add_argument("--out", help="write per-question scores to this Parquet file")
+    parser.add_argument("--every", type=float, help="rescore every N seconds")
+    args = parser.parse_args()
+
+    db = create_mongo_client(args.mongo_uri)[DB_NAME]
+    while True:
+        start = time.time()
+        key, choices, embedded, current = load_answer_key(db)
+        if args.table:
+            table = pd.read_parquet(args.table)
+        else:
+            table = pd.DataFrame(iter_abstract_rows(db["users"]))
+        table = table.join(answer_versions(table, embedded, current))
+        scores = score(table, key, choices)
+        print(f"Scored {len(scores)} answers in {time.time() - start:.2f}s")
+
+        answered = table[[f"{q}_answers" for q in QUESTION_KEYS]].notna().any(axis=1)
+        legacy = int((answered & (table["version_source"] == "current")).sum())
+        if legacy:
+            print(f"{legacy} submission(s) predate recorded versions, scored against the current text")
+        missing = unscored(table, key)
+        if len(missing):
+            print(f"{len(missing)} submission(s) have no answer key and were not scored:")
+            print(missing[ANSWER_IDS + ["version"]].to_string(index=False))
+        for by in SUMMARY_LEVELS:
+            print()
+            print(summarize(scores, by).round(3).to_string())
+        if args.out:
+            scores.to_parquet(args.out, index=False)
+        if not args.every:
+            break
+        time.sleep(args.every)
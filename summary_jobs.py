@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_JOBS = 500
+
+
+class SummaryJobs:
+    """Speculative summary generation keyed by (prolific_id, batch_id, abstract_id).
+
+    A job remembers the conversation it was started from; a result is only
+    handed out for the same conversation, otherwise the caller regenerates.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_jobs=DEFAULT_MAX_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary")
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, key, conversation_text, fn, *args):
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job[0] == conversation_text:
+                return job[1]
+            if job is not None:
+                # conversation moved on, the old speculative summary is useless
+                job[1].cancel()
+            future = self.executor.submit(fn, *args)
+            self.jobs[key] = (conversation_text, future)
+            self.jobs.move_to_end(key)
+            # drop jobs from abandoned sessions
+            while len(self.jobs) > self.max_jobs:
+                _, (_, old) = self.jobs.popitem(last=False)
+                old.cancel()
+            return future
+
+    def pop_result(self, key, conversation_text, timeout=None):
+        """Result for a matching job (waiting if it is still running), else None."""
+        with self.lock:
+            job = self.jobs.pop(key, None)
+        if job is None or job[0] != conversation_text:
+            if job is not None:
+                job[1].cancel()
+            return None
+        try:
+            return job[1].result(timeout=timeout)
+        except Exception as e:
+            print("Speculative summary failed, regenerating:", repr(e))
+            return None
+
+
+# one pool per server process, shared by every session
+@st.cache_resource
+def get_summary_jobs():
+    return SummaryJobs(
+        max_workers=int(st.secrets.get("SUMMARY_WORKERS", DEFAULT_MAX_WORKERS)),
+    )